@@ -1,15 +1,69 @@
 # celeryapp.py
 import os
-from celery import Celery
+from celery import Celery, Task
+from kombu import Queue
+
+from services.redis_client import get_redis
+from services.error_logging import log_error_once
+from services.routing import DEFAULT_PRIORITY, LONG_QUEUE, MEDIUM_QUEUE, SHORT_QUEUE
+from services.runpod_client import RUNPOD_JOB_TIMEOUT
+from services.runpod_governor import RUNPOD_SLOT_WAIT_TIMEOUT
 
 # Example: read broker/backends from environment or default to local Redis
 BROKER_URL = os.getenv("CELERY_BROKER_URL")
 RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
 
+# Download and segmentation time allowed on top of the RunPod wait.
+JOB_PREPARE_MARGIN = float(os.getenv("JOB_PREPARE_MARGIN", "1800"))
+# Redis redelivers an unacked task after this, so it must outlast the
+# longest legitimate run: chunks start while the job is being prepared and
+# each waits at most RUNPOD_SLOT_WAIT_TIMEOUT + RUNPOD_JOB_TIMEOUT.
+BROKER_VISIBILITY_TIMEOUT = int(os.getenv(
+    "BROKER_VISIBILITY_TIMEOUT",
+    str(int(JOB_PREPARE_MARGIN + RUNPOD_SLOT_WAIT_TIMEOUT + RUNPOD_JOB_TIMEOUT))
+))
+
+# A task redelivered more often than this (e.g. one that keeps killing its
+# worker, say OOM on huge media) fails instead of being requeued (0 = no limit).
+TASK_MAX_REDELIVERIES = int(os.getenv("TASK_MAX_REDELIVERIES", "3"))
+
+def count_redelivery(task_id: str) -> int:
+    """
+    Counts one more redelivery of 'task_id'; 0 without Redis.
+    """
+    r = get_redis()
+    if r is None:
+        return 0
+    key = f"redeliveries:{task_id}"
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.expire(key, BROKER_VISIBILITY_TIMEOUT * (TASK_MAX_REDELIVERIES + 2))
+        return pipe.execute()[0]
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in count_redelivery in celeryapp.py")
+        return 0
+
+class RedeliveryLimitedTask(Task):
+    """
+    With acks_late, a task whose worker dies is redelivered; this bounds how
+    often. Retries and replaced tasks are new messages and do not count.
+    """
+    def __call__(self, *args, **kwargs):
+        redelivered = (self.request.delivery_info or {}).get("redelivered")
+        if redelivered and TASK_MAX_REDELIVERIES > 0:
+            deliveries = count_redelivery(self.request.id)
+            if deliveries > TASK_MAX_REDELIVERIES:
+                error = RuntimeError(f"Task {self.request.id} was redelivered {deliveries} times; giving up.")
+                log_error_once(error, f"The error: {str(error)}, in {self.name} in celeryapp.py")
+                raise error
+        return super().__call__(*args, **kwargs)
+
 celery = Celery(
     "video_render",
     broker=BROKER_URL,
-    backend=RESULT_BACKEND
+    backend=RESULT_BACKEND,
+    task_cls=RedeliveryLimitedTask
 )
 
 celery.conf.update(
@@ -17,6 +71,20 @@ celery.conf.update(
     result_serializer='json',
     accept_content=['json'],
     worker_prefetch_multiplier=1,  # avoids one worker grabbing too many tasks at once
-    broker_transport_options={'visibility_timeout': 3600},  # 1 hour
+    task_track_started=True,  # lets /task_status report STARTED
+    # Ack after the task finishes, and requeue it if its worker dies, so an
+    # interrupted job is redelivered and resumes from its chunk checkpoints
+    # (at most TASK_MAX_REDELIVERIES times, see RedeliveryLimitedTask).
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    broker_transport_options={
+        'visibility_timeout': BROKER_VISIBILITY_TIMEOUT,
+        'priority_steps': list(range(10)),  # 0 (first) .. 9 (last), see services/routing.py
+        # a worker consuming several queues (-Q short,medium,long) drains them in that order
+        'queue_order_strategy': 'priority',
+    },
+    task_default_queue=MEDIUM_QUEUE,
+    task_default_priority=DEFAULT_PRIORITY,
     imports=("tasks",),
 )
+celery.conf.task_queues = (Queue(SHORT_QUEUE), Queue(MEDIUM_QUEUE), Queue(LONG_QUEUE))
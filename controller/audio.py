@@ -1,12 +1,14 @@
 import os
 from fastapi import HTTPException
 
-from services.helper import  safe_remove, single_pass_chunk_and_transcribe
+from services.helper import SEGMENT_TIME, safe_remove, single_pass_chunk_and_transcribe
 from services.error_logging import raise_http_exception_once
 
-async def transcribe_audio_file(file_path: str):
+async def transcribe_audio_file(file_path: str, on_progress=None, job_id: str = None):
     try:
-        transcription_result = await single_pass_chunk_and_transcribe(file_path, chunk_size=1200)
+        transcription_result = await single_pass_chunk_and_transcribe(
+            file_path, segment_time=SEGMENT_TIME, on_progress=on_progress, job_id=job_id
+        )
         return {
             "status_code": 200,
             "data": transcription_result
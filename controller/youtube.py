@@ -1,47 +1,195 @@
 import asyncio
 import os
+import time
 import requests
 import uuid
 import subprocess
 from fastapi import HTTPException
-from services.helper import handle_audio_download_and_transcribe
-from services.youtube_helper import download_youtube_audio, get_all_transcripts_with_fallback, get_video_metadata
+from services.helper import (
+    get_transcription_settings,
+    handle_audio_download_and_transcribe,
+    safe_remove,
+    streamed_chunk_and_transcribe
+)
+from services.youtube_helper import (
+    YOUTUBE_SPECULATIVE_DOWNLOAD_AFTER,
+    YOUTUBE_STREAM_AUDIO,
+    download_youtube_audio,
+    extract_video_id,
+    get_all_transcripts_with_fallback,
+    get_cached_youtube_asr,
+    get_video_metadata,
+    speculative_audio_download,
+    store_cached_youtube_asr,
+    youtube_audio_stream
+)
 from services.error_logging import raise_http_exception_once
 
-async def transcribe_youtube_video(youtube_url: str, is_runpod: bool = False):
+def runpod_result(video_metadata: dict, transcription_result: dict) -> dict:
+    transcription_result.update(video_metadata)
+    return {
+        "is_transcript": False,
+        "title": video_metadata.get("title"),
+        "thumbnail": video_metadata.get("thumbnail"),
+        "video_duration": video_metadata.get("video_duration"),
+        "data": transcription_result
+    }
+
+def deferred_asr(local_path: str, video_id: str, video_metadata: dict, asr_settings: dict,
+                 stream_url: str = None) -> dict:
+    return {
+        "pending_asr": {
+            "local_path": local_path,
+            "stream_url": stream_url,
+            "video_id": video_id,
+            "video_metadata": video_metadata,
+            "settings": asr_settings
+        }
+    }
+
+async def streamed_asr(youtube_url: str, video_id: str, video_metadata: dict, asr_settings: dict,
+                       on_progress=None, defer_asr: bool = False, job_id: str = None) -> dict:
+    """
+    RunPod transcription with yt-dlp piped into the segmenter: chunks go to
+    RunPod while the audio is still downloading.
+    """
+    if defer_asr:
+        return deferred_asr(None, video_id, video_metadata, asr_settings, stream_url=youtube_url)
+    transcription_result = await streamed_chunk_and_transcribe(
+        youtube_audio_stream(youtube_url), asr_settings["segment_time"], on_progress, job_id
+    )
+    await asyncio.to_thread(store_cached_youtube_asr, video_id, asr_settings, transcription_result)
+    return runpod_result(video_metadata, transcription_result)
+
+def check_duration(video_metadata: dict):
+    if video_metadata.get("duration_seconds", 0) > 7200:
+        raise HTTPException(
+            status_code=400, 
+            detail="Only videos shorter than 2 hours are supported. Please upload a shorter video."
+        )
+
+async def discard_download(job):
+    """
+    Cancels a speculative download that is no longer needed and removes its
+    file if it already finished.
+    """
+    if job is None:
+        return
+    job.cancel()
+    try:
+        data = await job
+    except (asyncio.CancelledError, Exception):
+        return
+    safe_remove(data["local_path"])
+
+async def fallback_audio(youtube_url: str, speculative=None) -> dict:
+    """
+    The audio for RunPod: the speculative download if one is running and
+    succeeds, otherwise a regular download.
+    """
+    if speculative is not None:
+        try:
+            return await speculative
+        except HTTPException as e:
+            print(f"[Fallback] Speculative download failed ({e.detail}). Downloading audio...")
+    else:
+        print("[Fallback] No captions. Downloading audio...")
+    return await asyncio.to_thread(download_youtube_audio, youtube_url)
+
+async def download_asr(data: dict, video_id: str, video_metadata: dict, asr_settings: dict,
+                       on_progress=None, defer_asr: bool = False, job_id: str = None,
+                       single_call: bool = False) -> dict:
+    """
+    RunPod transcription of the downloaded audio in 'data' (see download_youtube_audio).
+    """
+    url = data.get("download_url")
+    local_path = data.get("local_path")
+    if not url:
+        raise HTTPException(
+            status_code=500, 
+            detail="Failed to retrieve fallback audio link."
+        )
+    if defer_asr:
+        return deferred_asr(local_path, video_id, video_metadata, asr_settings)
+    transcription_result = await handle_audio_download_and_transcribe(
+        local_path, url, asr_settings["segment_time"], on_progress, job_id, single_call
+    )
+    await asyncio.to_thread(store_cached_youtube_asr, video_id, asr_settings, transcription_result)
+    # Unified output structure for runpod branch (if needed you can wrap it inside "data")
+    return runpod_result(video_metadata, transcription_result)
+
+async def transcribe_youtube_video(youtube_url: str, is_runpod: bool = False, use_cache: bool = True,
+                                   on_progress=None, defer_asr: bool = False, job_id: str = None,
+                                   single_call: bool = False):
+    """
+    With 'defer_asr', audio that needs RunPod transcription is only downloaded;
+    the result is {"pending_asr": {...}} and the caller transcribes it.
+    With 'single_call', the audio is sent to RunPod in one piece (short videos).
+    Blocking steps run in threads, so this can also be awaited in the API.
+    With YOUTUBE_STREAM_AUDIO the audio is streamed rather than downloaded
+    (not with 'single_call').
+    """
     try:
+        video_id = extract_video_id(youtube_url)
+        stream_audio = YOUTUBE_STREAM_AUDIO and not single_call
+        # streamed audio is always cut into fixed chunks without overlap
+        asr_settings = (
+            get_transcription_settings(chunking="fixed", overlap=0.0) if stream_audio
+            else get_transcription_settings()
+        )
+        preflight_start = time.monotonic()
         # Get video metadata including title, thumbnail, video_duration and duration_seconds
-        video_metadata = get_video_metadata(youtube_url)
+        metadata_job = asyncio.ensure_future(
+            asyncio.to_thread(get_video_metadata, youtube_url, use_cache=use_cache)
+        )
 
         if is_runpod:
+            cached_job = asyncio.ensure_future(
+                asyncio.to_thread(get_cached_youtube_asr, video_id, asr_settings)
+            ) if use_cache else None
+            video_metadata = await metadata_job
             # Check if video duration is less than 2 hours
-            if video_metadata.get("duration_seconds", 0) > 7200:
-                raise HTTPException(
-                    status_code=400, 
-                    detail="Only videos shorter than 2 hours are supported. Please upload a shorter video."
+            check_duration(video_metadata)
+            cached_asr = await cached_job if cached_job is not None else None
+            if cached_asr is not None:
+                return runpod_result(video_metadata, dict(cached_asr, cached=True))
+            if stream_audio:
+                return await streamed_asr(
+                    youtube_url, video_id, video_metadata, asr_settings, on_progress, defer_asr, job_id
                 )
-            data = download_youtube_audio(youtube_url)
-            url = data.get("download_url")
-            local_path = data.get("local_path")
-            if not url:
+            data = await asyncio.to_thread(download_youtube_audio, youtube_url)
+            if not data.get("download_url"):
                 raise HTTPException(
                     status_code=400, 
                     detail="Failed to retrieve MP3 link for RunPod."
                 )
-            transcription_result = await handle_audio_download_and_transcribe(local_path, url, 1200)
-            transcription_result.update(video_metadata)
-            # Unified output structure for runpod branch (if needed you can wrap it inside "data")
-            return {
-                "is_transcript": False,
-                "title": video_metadata.get("title"),
-                "thumbnail": video_metadata.get("thumbnail"),
-                "video_duration": video_metadata.get("video_duration"),
-                "data": transcription_result
-            }
+            return await download_asr(
+                data, video_id, video_metadata, asr_settings, on_progress, defer_asr, job_id, single_call
+            )
+
+        # Caption listing runs alongside the metadata call; audio is only
+        # fetched once the duration is known to be within the limit.
+        captions_job = asyncio.ensure_future(asyncio.to_thread(
+            get_all_transcripts_with_fallback, youtube_url, use_cache=use_cache, asr_settings=asr_settings
+        ))
+        speculative = None
+        try:
+            video_metadata = await metadata_job
+            too_long = video_metadata.get("duration_seconds", 0) > 7200
+            if YOUTUBE_SPECULATIVE_DOWNLOAD_AFTER > 0 and not too_long and not stream_audio:
+                wait = YOUTUBE_SPECULATIVE_DOWNLOAD_AFTER - (time.monotonic() - preflight_start)
+                done, _ = await asyncio.wait({captions_job}, timeout=max(0.0, wait))
+                if not done:
+                    speculative = asyncio.ensure_future(speculative_audio_download(youtube_url))
+            # Get transcripts or fallback data
+            data = await captions_job
+        except BaseException:
+            captions_job.cancel()
+            await discard_download(speculative)
+            raise
 
-        # Get transcripts or fallback data
-        data = get_all_transcripts_with_fallback(youtube_url)
         if data.get("is_transcript"):
+            await discard_download(speculative)
             # When captions are available, wrap the transcript data into a "data" field.
             result_data = {
                 "is_transcript": True,
@@ -55,30 +203,20 @@ async def transcribe_youtube_video(youtube_url: str, is_runpod: bool = False):
                 }
             }
             return result_data
-        else:
-            # Fallback branch: use runpod transcription
-            url = data.get("url")
-            local_file_path = data.get("local_path")
-            if not url:
-                raise HTTPException(
-                    status_code=500, 
-                    detail="Failed to retrieve fallback audio link."
-                )
-            if video_metadata.get("duration_seconds", 0) > 7200:
-                raise HTTPException(
-                    status_code=400, 
-                    detail="Only videos shorter than 2 hours are supported. Please upload a shorter video."
-                )
-            transcription_result = await handle_audio_download_and_transcribe(local_file_path, url, 1200)
-            transcription_result.update(video_metadata)
-            result_data = {
-                "is_transcript": False,
-                "title": video_metadata.get("title"),
-                "thumbnail": video_metadata.get("thumbnail"),
-                "video_duration": video_metadata.get("video_duration"),
-                "data": transcription_result
-            }
-            return result_data
+        elif data.get("cached_transcription") is not None:
+            await discard_download(speculative)
+            return runpod_result(video_metadata, dict(data["cached_transcription"], cached=True))
+
+        # Fallback branch: use runpod transcription
+        check_duration(video_metadata)
+        if stream_audio:
+            return await streamed_asr(
+                youtube_url, video_id, video_metadata, asr_settings, on_progress, defer_asr, job_id
+            )
+        data = await fallback_audio(youtube_url, speculative)
+        return await download_asr(
+            data, video_id, video_metadata, asr_settings, on_progress, defer_asr, job_id, single_call
+        )
 
     except Exception as e:
         raise_http_exception_once(
@@ -1,15 +1,73 @@
 import os
 import time
+import uuid
+import asyncio
 from fastapi import FastAPI, UploadFile, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-from services.helper import check_api_key, save_upload_file
-from tasks import process_audio_task, process_video_task, process_youtube_task
+from services.helper import (
+    check_api_key,
+    get_audio_duration,
+    get_transcription_settings,
+    ingest_stream_to_chunks,
+    safe_remove,
+    save_upload_file,
+    transcribe_short_file
+)
+from controller.youtube import transcribe_youtube_video
+from tasks import (
+    cacheable_transcription,
+    cached_upload_result,
+    process_audio_task,
+    process_streamed_video_task,
+    process_video_task,
+    process_youtube_task,
+    youtube_task_result
+)
 from celeryapp import celery
 from celery.result import AsyncResult
+from celery.backends.base import KeyValueStoreBackend
+from services.runpod_webhook import check_webhook_token, publish_job_result
+from services.metrics import render_prometheus
+from services.task_events import FINAL_STATES, PROGRESS_STATE, snapshot_after_change, task_event_stream
+from services.redis_client import get_async_redis
+from services.cache import TRANSCRIPT_CACHE_NAMESPACE, get_cache_stats, get_cached_transcript, store_cached_transcript
+from services.youtube_helper import (
+    YOUTUBE_ASR_NAMESPACE,
+    YOUTUBE_CAPTIONS_NAMESPACE,
+    YOUTUBE_METADATA_NAMESPACE,
+    extract_video_id,
+    get_video_metadata
+)
+from services.routing import routing_for_duration
+from services.admission import check_admission
+from services.fair_queue import (
+    FAIR_QUEUE_DEFAULT_COST,
+    FAIR_QUEUE_TICK_INTERVAL,
+    claim_running_slot,
+    release_running_slot,
+    run_dispatch_ticker,
+    submit_fair
+)
+from services.tenants import (
+    charge_audio_minutes,
+    get_quota_usage,
+    get_tenant,
+    refund_audio_minutes,
+    refund_failed_job,
+    remember_charge
+)
+from services.singleflight import (
+    claim_inflight,
+    get_idempotent_task,
+    idempotency_request_key,
+    inflight_key,
+    release_inflight,
+    remember_idempotent_task
+)
 from services.error_logging import log_error_once, raise_http_exception_once
 
 load_dotenv()
@@ -23,7 +81,8 @@ async def custom_http_exception_handler(request: Request, exc: HTTPException):
          content={
               "status_code": exc.status_code,
               "data": {"detail": exc.detail}
-         }
+         },
+         headers=getattr(exc, "headers", None)  # e.g. Retry-After on 429
     )
 
 app.add_middleware(
@@ -34,12 +93,128 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+@app.on_event("startup")
+async def start_dispatch_ticker():
+    if FAIR_QUEUE_TICK_INTERVAL > 0:
+        app.state.dispatch_ticker = asyncio.create_task(run_dispatch_ticker())
+
+@app.on_event("shutdown")
+async def stop_dispatch_ticker():
+    ticker = getattr(app.state, "dispatch_ticker", None)
+    if ticker is not None:
+        ticker.cancel()
+
+BULK_STATUS_MAX_IDS = int(os.getenv("BULK_STATUS_MAX_IDS", "1000"))
+# sync=true requests for media up to this long are transcribed inline.
+SYNC_MAX_SECONDS = float(os.getenv("SYNC_MAX_SECONDS", "60"))
+
+class BulkTaskStatusRequest(BaseModel):
+    task_ids: list[str]
+
 class YouTubeRequest(BaseModel):
     youtube_url: str
     is_runpod: bool = False
+    no_cache: bool = False
+    sync: bool = False
+
+async def probe_upload_duration(file_path: str):
+    try:
+        return await asyncio.to_thread(get_audio_duration, file_path)
+    except Exception:
+        return None
+
+async def probe_youtube_duration(youtube_url: str, use_cache: bool = True):
+    try:
+        metadata = await asyncio.to_thread(get_video_metadata, youtube_url, use_cache)
+        return metadata.get("duration_seconds")
+    except Exception:
+        return None
+
+async def charge_quota(tenant: dict, duration, *cleanup_paths: str) -> float:
+    """
+    Books the media's minutes against the customer's monthly quota, or
+    rejects the request with 429 (and drops its upload) when it is used up.
+    Media whose duration could not be probed is charged
+    FAIR_QUEUE_DEFAULT_COST. Returns the seconds charged.
+    """
+    seconds = duration or FAIR_QUEUE_DEFAULT_COST
+    allowed, used, reset_in = await asyncio.to_thread(charge_audio_minutes, tenant, seconds)
+    if not allowed:
+        for path in cleanup_paths:
+            if path:
+                safe_remove(path)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Monthly audio quota of {tenant['quota_minutes']:g} minutes reached ({used:.1f} used).",
+            headers={"Retry-After": str(reset_in)}
+        )
+    return seconds
+
+def submit_once(flight_key: str, task, args: tuple, kwargs: dict, options: dict = None,
+                tenant: dict = None, cost: float = None) -> tuple:
+    """
+    Enqueues 'task' (with apply_async 'options', e.g. queue and priority)
+    unless a job for 'flight_key' (same video or same file content) is
+    already in flight. The job goes through the customer's weighted fair
+    queue; 'cost' is the seconds charged to the customer, refunded if the
+    job fails or the submission is a duplicate. Returns (task_id, deduplicated).
+    """
+    task_id = str(uuid.uuid4())
+    existing = claim_inflight(flight_key, task_id)
+    if existing and AsyncResult(existing, app=celery).state in FINAL_STATES:
+        # finished without releasing its claim (e.g. its worker died)
+        release_inflight(existing)
+        existing = claim_inflight(flight_key, task_id)
+    if existing:
+        refund_audio_minutes(tenant, cost)
+        return existing, True
+    remember_charge(task_id, tenant, cost)
+    try:
+        submit_fair(task.name, args, kwargs, options, task_id, tenant, cost)
+    except Exception:
+        release_inflight(task_id)
+        refund_failed_job(task_id, failed=True)
+        raise
+    return task_id, False
+
+def fits_sync_path(duration) -> bool:
+    return duration is not None and 0 < duration <= SYNC_MAX_SECONDS
+
+async def transcribe_upload_sync(upload: dict, start_time: float, main_upload_time: float, use_cache: bool) -> dict:
+    """
+    sync=true fast path for short uploads: one RunPod call, answered in the
+    HTTP response. Same result shape as a finished process_audio_task.
+    """
+    settings = get_transcription_settings()
+    try:
+        if use_cache:
+            cached = await asyncio.to_thread(get_cached_transcript, upload["content_hash"], settings)
+            if cached is not None:
+                return cached_upload_result(cached, start_time, main_upload_time)
+        transcription = await transcribe_short_file(upload["file_path"])
+    finally:
+        safe_remove(upload["file_path"])
+
+    await asyncio.to_thread(store_cached_transcript, upload["content_hash"], settings, cacheable_transcription(transcription))
+    data_dict = dict(transcription)
+    data_dict.pop("chunk_time", None)
+    data_dict["upload_time"] = main_upload_time
+    data_dict["total_time"] = time.time() - start_time
+    return {"status_code": 200, "data": data_dict}
+
+def queued_response(task_id: str, deduplicated: bool = False) -> dict:
+    return {"status_code": 200, "task_id": task_id, "status": "queued", "deduplicated": deduplicated}
 
 @app.post("/transcribe_audio")
-async def transcribe_audio_endpoint(file: UploadFile, api_key: str = Header(None)):
+async def transcribe_audio_endpoint(file: UploadFile, no_cache: bool = False, sync: bool = False,
+                                    api_key: str = Header(None), idempotency_key: str = Header(None)):
+    """
+    Uploads of a file that is already being transcribed, and retries with
+    the same Idempotency-Key header, get the task id of the existing job.
+    With sync=true, clips up to SYNC_MAX_SECONDS are transcribed inline and
+    the result is returned directly; longer ones, and clips from a customer
+    already at its concurrency cap, are queued as usual.
+    """
     if not api_key or not check_api_key(api_key):
         raise_http_exception_once(
             Exception("API Key mismatch"),
@@ -56,16 +231,54 @@ async def transcribe_audio_endpoint(file: UploadFile, api_key: str = Header(None
             f"Error: Received file with content_type {file.content_type} in transcribe_audio_endpoint in main.py"
         )
 
+    tenant = get_tenant(api_key)
+    request_key = (
+        idempotency_request_key("transcribe_audio", idempotency_key, tenant["name"]) if idempotency_key else None
+    )
+    existing = get_idempotent_task(request_key)
+    if existing:
+        return queued_response(existing, deduplicated=True)
+    await check_admission()
+
     start_time = time.time()
-    file_path = save_upload_file(file)
+    upload = await save_upload_file(file)
+    file_path = upload["file_path"]
     file_saved_time = time.time()
 
     main_upload_time = file_saved_time - start_time
-    job = process_audio_task.delay(file_path, start_time, main_upload_time)
-    return {"status_code": 200, "task_id": job.id, "status": "queued"}
+    duration = await probe_upload_duration(file_path)
+    charged = await charge_quota(tenant, duration, file_path)
+    sync_slot = f"sync:{uuid.uuid4().hex}"
+    if sync and fits_sync_path(duration) and await asyncio.to_thread(claim_running_slot, tenant, sync_slot):
+        try:
+            return await transcribe_upload_sync(upload, start_time, main_upload_time, use_cache=not no_cache)
+        except BaseException:
+            refund_audio_minutes(tenant, charged)
+            raise
+        finally:
+            await asyncio.to_thread(release_running_slot, tenant, sync_slot)
+
+    flight_key = None if no_cache else inflight_key("audio", upload["content_hash"])
+    task_id, deduplicated = submit_once(
+        flight_key,
+        process_audio_task,
+        (file_path, start_time, main_upload_time),
+        {"content_hash": upload["content_hash"], "use_cache": not no_cache},
+        routing_for_duration(duration),
+        tenant,
+        charged
+    )
+    if deduplicated:
+        safe_remove(file_path)
+    return queued_response(remember_idempotent_task(request_key, task_id), deduplicated)
 
 @app.post("/transcribe_video")
-async def transcribe_video_endpoint(file: UploadFile, api_key: str = Header(None)):
+async def transcribe_video_endpoint(file: UploadFile, no_cache: bool = False, api_key: str = Header(None),
+                                    idempotency_key: str = Header(None)):
+    """
+    Uploads of a file that is already being transcribed, and retries with
+    the same Idempotency-Key header, get the task id of the existing job.
+    """
     if not api_key or not check_api_key(api_key):
         raise_http_exception_once(
             Exception("API Key mismatch"),
@@ -82,47 +295,329 @@ async def transcribe_video_endpoint(file: UploadFile, api_key: str = Header(None
             f"Error: Received file with content_type {file.content_type} in transcribe_video_endpoint in main.py"
         )
 
+    tenant = get_tenant(api_key)
+    request_key = (
+        idempotency_request_key("transcribe_video", idempotency_key, tenant["name"]) if idempotency_key else None
+    )
+    existing = get_idempotent_task(request_key)
+    if existing:
+        return queued_response(existing, deduplicated=True)
+    await check_admission()
+
     start_time = time.time()
-    file_path = save_upload_file(file)
+    upload = await save_upload_file(file)
+    file_path = upload["file_path"]
     file_saved_time = time.time()
 
     main_upload_time = file_saved_time - start_time
-    job = process_video_task.delay(file_path, start_time, main_upload_time)
-    return {"status_code": 200, "task_id": job.id, "status": "queued"}
+    duration = await probe_upload_duration(file_path)
+    charged = await charge_quota(tenant, duration, file_path)
 
-@app.post("/transcribe_youtube")
-async def transcribe_youtube_endpoint(request: YouTubeRequest, api_key: str = Header(None)):
+    flight_key = None if no_cache else inflight_key("video", upload["content_hash"])
+    task_id, deduplicated = submit_once(
+        flight_key,
+        process_video_task,
+        (file_path, start_time, main_upload_time),
+        {"content_hash": upload["content_hash"], "use_cache": not no_cache},
+        routing_for_duration(duration),
+        tenant,
+        charged
+    )
+    if deduplicated:
+        safe_remove(file_path)
+    return queued_response(remember_idempotent_task(request_key, task_id), deduplicated)
+
+@app.post("/transcribe_video/stream")
+async def transcribe_video_stream_endpoint(request: Request, no_cache: bool = False, api_key: str = Header(None),
+                                           idempotency_key: str = Header(None)):
+    """
+    Streaming ingest: the raw request body (the video itself, not a
+    multipart form) is piped into ffmpeg while it is still arriving, and
+    only the audio chunks are written to disk. Needs a container ffmpeg can
+    read from a pipe (MKV, WebM, MPEG-TS, MP4 with faststart); other files
+    should go through /transcribe_video.
+    """
     if not api_key or not check_api_key(api_key):
         raise_http_exception_once(
             Exception("API Key mismatch"),
             403,
             "Unauthorized",
-            "The error: Unauthorized API key, in transcribe_youtube_endpoint in main.py"
+            "The error: Unauthorized API key, in transcribe_video_stream_endpoint in main.py"
+        )
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("video/"):
+        raise_http_exception_once(
+            Exception("Invalid file type"),
+            400,
+            "Invalid file type: Expected video file",
+            f"Error: Received file with content_type {content_type} in transcribe_video_stream_endpoint in main.py"
         )
 
+    tenant = get_tenant(api_key)
+    request_key = (
+        idempotency_request_key("transcribe_video_stream", idempotency_key, tenant["name"]) if idempotency_key else None
+    )
+    existing = get_idempotent_task(request_key)
+    if existing:
+        return queued_response(existing, deduplicated=True)
+    await check_admission()
+
     start_time = time.time()
-    job = process_youtube_task.delay(request.youtube_url, request.is_runpod, start_time)
-    return {"status_code": 200, "task_id": job.id, "status": "queued"}
+    ingest = await ingest_stream_to_chunks(request.stream())
+    chunks = ingest["chunks"]
+    chunk_paths = [chunk["path"] for chunk in chunks]
+    # upload and audio extraction ran together
+    main_upload_time = time.time() - start_time
 
-@app.get("/task_status/{task_id}")
-def get_task_status(task_id: str, api_key: str = Header(None)):
+    duration = ingest["duration"]
+    charged = await charge_quota(tenant, duration, *chunk_paths)
+
+    flight_key = None if no_cache else inflight_key("video_stream", ingest["content_hash"])
+    task_id, deduplicated = submit_once(
+        flight_key,
+        process_streamed_video_task,
+        (chunks, start_time, main_upload_time),
+        {"content_hash": ingest["content_hash"], "use_cache": not no_cache},
+        routing_for_duration(duration),
+        tenant,
+        charged
+    )
+    if deduplicated:
+        for path in chunk_paths:
+            safe_remove(path)
+    return queued_response(remember_idempotent_task(request_key, task_id), deduplicated)
+
+@app.post("/transcribe_youtube")
+async def transcribe_youtube_endpoint(request: YouTubeRequest, api_key: str = Header(None)):
     if not api_key or not check_api_key(api_key):
         raise_http_exception_once(
             Exception("API Key mismatch"),
             403,
             "Unauthorized",
-            "The error: Unauthorized API key, in get_task_status in main.py"
+            "The error: Unauthorized API key, in transcribe_youtube_endpoint in main.py"
         )
+
+    await check_admission()
+
+    flight_key = None
+    if not request.no_cache:
+        try:
+            flight_key = inflight_key("youtube", f"{extract_video_id(request.youtube_url)}:{int(request.is_runpod)}")
+        except HTTPException:
+            pass  # the task reports invalid URLs as before
+
+    start_time = time.time()
+    tenant = get_tenant(api_key)
+    duration = await probe_youtube_duration(request.youtube_url, not request.no_cache)
+    charged = await charge_quota(tenant, duration)
+    sync_slot = f"sync:{uuid.uuid4().hex}"
+    if (request.sync and fits_sync_path(duration)
+            and await asyncio.to_thread(claim_running_slot, tenant, sync_slot)):
+        # Shorts: captions or a single RunPod call, answered inline
+        try:
+            result = await transcribe_youtube_video(
+                request.youtube_url, request.is_runpod, not request.no_cache, single_call=True
+            )
+        except BaseException:
+            refund_audio_minutes(tenant, charged)
+            raise
+        finally:
+            await asyncio.to_thread(release_running_slot, tenant, sync_slot)
+        return youtube_task_result(result, start_time, time.time(), start_time)
+
+    task_id, deduplicated = submit_once(
+        flight_key,
+        process_youtube_task,
+        (request.youtube_url, request.is_runpod, start_time),
+        {"use_cache": not request.no_cache},
+        routing_for_duration(duration),
+        tenant,
+        charged
+    )
+    return queued_response(task_id, deduplicated)
+
+def task_snapshot(task_id: str) -> tuple:
     res = AsyncResult(task_id, app=celery)
     if res.ready():
+        result = res.result if res.successful() else {"status_code": 500, "state": res.state}
+        return res.state, result
+    if res.state == PROGRESS_STATE and isinstance(res.info, dict):
+        return res.state, {
+            "progress": res.info.get("progress"),
+            "partial_transcript": res.info.get("partial_transcript", [])
+        }
+    return res.state, {}
+
+def task_status_response(task_id: str, state: str, payload: dict) -> dict:
+    if state in FINAL_STATES:
         return {
             "status_code": 200,
             "task_id": task_id,
             "status": "completed",
-            "result": res.result
+            "result": payload
+        }
+    elif state == PROGRESS_STATE:
+        return {
+            "status_code": 200,
+            "task_id": task_id,
+            "status": state,
+            "progress": payload.get("progress"),
+            "partial_transcript": payload.get("partial_transcript", [])
         }
     else:
-        return {"status_code": 200, "task_id": task_id, "status": res.state}
+        return {"status_code": 200, "task_id": task_id, "status": state}
+
+@app.get("/task_status/{task_id}")
+async def get_task_status(task_id: str, wait: float = 0, api_key: str = Header(None)):
+    """
+    'wait' (seconds, capped at TASK_STATUS_MAX_WAIT) holds the request until
+    the task changes state, reports progress or finishes.
+    """
+    if not api_key or not check_api_key(api_key):
+        raise_http_exception_once(
+            Exception("API Key mismatch"),
+            403,
+            "Unauthorized",
+            "The error: Unauthorized API key, in get_task_status in main.py"
+        )
+    state, payload = await snapshot_after_change(task_id, task_snapshot, wait)
+    return task_status_response(task_id, state, payload)
+
+@app.post("/task_status/bulk")
+def get_bulk_task_status(request: BulkTaskStatusRequest, api_key: str = Header(None)):
+    if not api_key or not check_api_key(api_key):
+        raise_http_exception_once(
+            Exception("API Key mismatch"),
+            403,
+            "Unauthorized",
+            "The error: Unauthorized API key, in get_bulk_task_status in main.py"
+        )
+    if len(request.task_ids) > BULK_STATUS_MAX_IDS:
+        raise_http_exception_once(
+            Exception("Too many task ids"),
+            400,
+            f"At most {BULK_STATUS_MAX_IDS} task ids per request.",
+            f"The error: {len(request.task_ids)} task ids requested, in get_bulk_task_status in main.py"
+        )
+
+    backend = celery.backend
+    if isinstance(backend, KeyValueStoreBackend):
+        # one MGET for every id instead of a round trip per AsyncResult
+        keys = [backend.get_key_for_task(task_id) for task_id in request.task_ids]
+        metas = [backend.decode_result(raw) if raw else None for raw in backend.mget(keys)]
+    else:
+        metas = [AsyncResult(task_id, app=celery)._get_task_meta() for task_id in request.task_ids]
+
+    statuses = {}
+    for task_id, meta in zip(request.task_ids, metas):
+        state = meta["status"] if meta else "PENDING"
+        result = meta.get("result") if meta else None
+        if state == PROGRESS_STATE and isinstance(result, dict):
+            # the partial transcript is left to /task_status/{task_id}
+            statuses[task_id] = {"status": state, "progress": result.get("progress")}
+        elif state in FINAL_STATES:
+            statuses[task_id] = {
+                "status": "completed",
+                "result": result if state == "SUCCESS" else {"status_code": 500, "state": state}
+            }
+        else:
+            statuses[task_id] = {"status": state}
+    return {"status_code": 200, "data": statuses}
+
+@app.get("/task_stream/{task_id}")
+async def task_stream_endpoint(task_id: str, api_key: str = Header(None)):
+    if not api_key or not check_api_key(api_key):
+        raise_http_exception_once(
+            Exception("API Key mismatch"),
+            403,
+            "Unauthorized",
+            "The error: Unauthorized API key, in task_stream_endpoint in main.py"
+        )
+    if get_async_redis() is None:
+        raise_http_exception_once(
+            Exception("No Redis configured"),
+            503,
+            "Task streaming is not available.",
+            "The error: task streaming needs Redis, in task_stream_endpoint in main.py"
+        )
+    return StreamingResponse(
+        task_event_stream(task_id, task_snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/runpod/webhook")
+async def runpod_webhook_endpoint(request: Request, token: str = None):
+    if not check_webhook_token(token):
+        raise_http_exception_once(
+            Exception("Webhook token mismatch"),
+            403,
+            "Unauthorized",
+            "The error: Unauthorized webhook token, in runpod_webhook_endpoint in main.py"
+        )
+    try:
+        job_result = await request.json()
+    except ValueError as e:
+        raise_http_exception_once(
+            e,
+            400,
+            "Invalid webhook payload: expected JSON",
+            f"The error: {str(e)}, in runpod_webhook_endpoint in main.py"
+        )
+    if not isinstance(job_result, dict) or not job_result.get("id"):
+        raise_http_exception_once(
+            Exception("No 'id' in webhook payload"),
+            400,
+            "Invalid webhook payload: missing job id",
+            "The error: Webhook payload does not contain 'id', in runpod_webhook_endpoint in main.py"
+        )
+    await publish_job_result(job_result)
+    return {"status_code": 200, "job_id": job_result["id"]}
+
+@app.get("/cache_stats")
+def cache_stats_endpoint(api_key: str = Header(None)):
+    if not api_key or not check_api_key(api_key):
+        raise_http_exception_once(
+            Exception("API Key mismatch"),
+            403,
+            "Unauthorized",
+            "The error: Unauthorized API key, in cache_stats_endpoint in main.py"
+        )
+    return {
+        "status_code": 200,
+        "data": {
+            namespace: get_cache_stats(namespace)
+            for namespace in (
+                TRANSCRIPT_CACHE_NAMESPACE,
+                YOUTUBE_METADATA_NAMESPACE,
+                YOUTUBE_CAPTIONS_NAMESPACE,
+                YOUTUBE_ASR_NAMESPACE
+            )
+        }
+    }
+
+@app.get("/quota")
+def quota_endpoint(api_key: str = Header(None)):
+    if not api_key or not check_api_key(api_key):
+        raise_http_exception_once(
+            Exception("API Key mismatch"),
+            403,
+            "Unauthorized",
+            "The error: Unauthorized API key, in quota_endpoint in main.py"
+        )
+    return {"status_code": 200, "data": get_quota_usage(get_tenant(api_key))}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint(api_key: str = Header(None)):
+    # scrape with the api-key header set (Prometheus http_headers)
+    if not api_key or not check_api_key(api_key):
+        raise_http_exception_once(
+            Exception("API Key mismatch"),
+            403,
+            "Unauthorized",
+            "The error: Unauthorized API key, in metrics_endpoint in main.py"
+        )
+    return render_prometheus()
 
 @app.get("/")
 def read_root():
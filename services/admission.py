@@ -0,0 +1,152 @@
+import os
+import math
+import time
+import shutil
+import asyncio
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from celeryapp import celery
+from services.redis_client import get_redis
+from services.fair_queue import PENDING_KEY
+from services.routing import LONG_QUEUE, MEDIUM_QUEUE, SHORT_QUEUE
+from services.runpod_governor import count_runpod_slots_in_use
+from services.error_logging import log_error_once
+
+load_dotenv()
+
+# New jobs are refused with 429 past any of these limits (0 = no limit).
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "0"))
+ADMISSION_MAX_RUNPOD_INFLIGHT = int(os.getenv("ADMISSION_MAX_RUNPOD_INFLIGHT", "0"))
+ADMISSION_MIN_FREE_BYTES = int(os.getenv("ADMISSION_MIN_FREE_BYTES", "0"))
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", "uploads")
+# Queue depth and disk space are re-read at most this often per API process.
+ADMISSION_CHECK_INTERVAL = float(os.getenv("ADMISSION_CHECK_INTERVAL", "2"))
+# Throughput is measured over finished jobs in this window.
+THROUGHPUT_WINDOW = float(os.getenv("THROUGHPUT_WINDOW", "900"))  # 15 minutes
+RETRY_AFTER_MIN = int(os.getenv("RETRY_AFTER_MIN", "5"))
+RETRY_AFTER_MAX = int(os.getenv("RETRY_AFTER_MAX", "3600"))
+RETRY_AFTER_DEFAULT = int(os.getenv("RETRY_AFTER_DEFAULT", "60"))
+
+COMPLETIONS_KEY = "admission:completions"
+
+_snapshot = {"at": 0.0, "value": None}
+
+def record_job_completion(task_id: str):
+    """
+    Called when a job finishes; the recent completion rate drives Retry-After.
+    """
+    r = get_redis()
+    if r is None or not task_id:
+        return
+    now = time.time()
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.zadd(COMPLETIONS_KEY, {task_id: now})
+        pipe.zremrangebyscore(COMPLETIONS_KEY, "-inf", now - THROUGHPUT_WINDOW)
+        pipe.expire(COMPLETIONS_KEY, int(THROUGHPUT_WINDOW) + 60)
+        pipe.execute()
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in record_job_completion in admission.py")
+
+def completed_jobs_per_second() -> float:
+    r = get_redis()
+    if r is None:
+        return 0.0
+    now = time.time()
+    try:
+        finished = r.zcount(COMPLETIONS_KEY, now - THROUGHPUT_WINDOW, now)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in completed_jobs_per_second in admission.py")
+        return 0.0
+    return finished / THROUGHPUT_WINDOW
+
+def broker_queue_depth() -> int:
+    """
+    Messages waiting in the transcription queues (all priorities). Read as
+    list lengths: a passive queue_declare fails on Redis for an empty queue,
+    since Redis deletes empty lists.
+    """
+    depth = 0
+    with celery.connection_for_read() as conn:
+        channel = conn.default_channel
+        for queue in (SHORT_QUEUE, MEDIUM_QUEUE, LONG_QUEUE):
+            depth += channel._size(queue)
+    return depth
+
+def fair_queue_depth() -> int:
+    """
+    Jobs still parked in the fair queue, not yet sent to the broker.
+    """
+    r = get_redis()
+    if r is None:
+        return 0
+    return r.zcard(PENDING_KEY)
+
+def _read_snapshot() -> dict:
+    depth = 0
+    if ADMISSION_MAX_QUEUE_DEPTH > 0:
+        try:
+            depth += broker_queue_depth()
+        except Exception as e:
+            log_error_once(e, f"The error: {str(e)}, in broker_queue_depth in admission.py")
+        try:
+            depth += fair_queue_depth()
+        except Exception as e:
+            log_error_once(e, f"The error: {str(e)}, in fair_queue_depth in admission.py")
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    return {
+        "queue_depth": depth,
+        "free_bytes": shutil.disk_usage(SCRATCH_DIR).free,
+        "throughput": completed_jobs_per_second()
+    }
+
+def admission_snapshot() -> dict:
+    now = time.monotonic()
+    if _snapshot["value"] is None or now - _snapshot["at"] >= ADMISSION_CHECK_INTERVAL:
+        _snapshot["value"] = _read_snapshot()
+        _snapshot["at"] = now
+    return _snapshot["value"]
+
+def retry_after_seconds(excess_jobs: int, throughput: float) -> int:
+    """
+    Time for the fleet to work off 'excess_jobs' at the observed throughput.
+    """
+    if throughput <= 0:
+        return RETRY_AFTER_DEFAULT
+    return int(min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, math.ceil(excess_jobs / throughput))))
+
+def reject(detail: str, retry_after: int):
+    print(f"Admission control: {detail} (Retry-After {retry_after}s)")
+    raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+async def check_admission():
+    """
+    Raises 429 with a Retry-After header when the backlog, the RunPod jobs
+    in flight or the free scratch space are past their limits. Runs before
+    an upload is written to disk.
+    """
+    snapshot = await asyncio.to_thread(admission_snapshot)
+    throughput = snapshot["throughput"]
+
+    if snapshot["free_bytes"] < ADMISSION_MIN_FREE_BYTES:
+        reject("Server is out of scratch space. Please retry later.", retry_after_seconds(1, throughput))
+
+    depth = snapshot["queue_depth"]
+    if ADMISSION_MAX_QUEUE_DEPTH > 0 and depth >= ADMISSION_MAX_QUEUE_DEPTH:
+        reject(
+            f"Too many queued jobs ({depth}). Please retry later.",
+            retry_after_seconds(depth - ADMISSION_MAX_QUEUE_DEPTH + 1, throughput)
+        )
+
+    if ADMISSION_MAX_RUNPOD_INFLIGHT > 0:
+        try:
+            inflight = await count_runpod_slots_in_use()
+        except Exception as e:
+            log_error_once(e, f"The error: {str(e)}, in count_runpod_slots_in_use in admission.py")
+            inflight = 0
+        if inflight >= ADMISSION_MAX_RUNPOD_INFLIGHT:
+            reject(
+                f"Too many transcriptions in progress ({inflight}). Please retry later.",
+                retry_after_seconds(inflight - ADMISSION_MAX_RUNPOD_INFLIGHT + 1, throughput)
+            )
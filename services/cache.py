@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+from services.redis_client import get_redis
+from services.error_logging import log_error_once
+
+load_dotenv()
+
+# "redis", "disk" or "off". Defaults to Redis when a Redis URL is configured, else disk.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "")
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+# Hit/miss counters for the disk backend live in this process only.
+_local_stats = {}
+_local_stats_lock = threading.Lock()
+
+def make_cache_key(*parts) -> str:
+    """
+    Builds a stable key from arbitrary JSON-serialisable parts.
+    """
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _backend() -> str:
+    if CACHE_BACKEND in ("redis", "disk", "off"):
+        return CACHE_BACKEND
+    return "redis" if get_redis() is not None else "disk"
+
+def _count(namespace: str, field: str):
+    if _backend() == "redis":
+        try:
+            get_redis().incr(f"cache:{namespace}:{field}")
+        except Exception as e:
+            # stats are best effort; never turn a lookup into a miss
+            log_error_once(e, f"The error: {str(e)}, in _count in cache.py")
+        return
+    with _local_stats_lock:
+        stats = _local_stats.setdefault(namespace, {"hits": 0, "misses": 0})
+        stats[field] += 1
+
+def _disk_path(namespace: str, key: str) -> str:
+    return os.path.join(CACHE_DIR, namespace, f"{key}.json")
+
+def _redis_get(namespace: str, key: str):
+    r = get_redis()
+    raw = r.get(f"cache:{namespace}:{key}")
+    if raw is None:
+        r.zrem(f"cache:{namespace}:lru", key)
+        return None
+    r.zadd(f"cache:{namespace}:lru", {key: time.time()})
+    return json.loads(raw)
+
+def _redis_set(namespace: str, key: str, value, ttl, max_entries: int):
+    r = get_redis()
+    lru_key = f"cache:{namespace}:lru"
+    pipe = r.pipeline()
+    pipe.set(f"cache:{namespace}:{key}", json.dumps(value), ex=ttl)
+    pipe.zadd(lru_key, {key: time.time()})
+    pipe.zcard(lru_key)
+    size = pipe.execute()[-1]
+    if size > max_entries:
+        evicted = r.zpopmin(lru_key, size - max_entries)
+        if evicted:
+            r.delete(*[f"cache:{namespace}:{k}" for k, _ in evicted])
+
+def _disk_get(namespace: str, key: str):
+    path = _disk_path(namespace, key)
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    expires_at = entry.get("expires_at")
+    if expires_at is not None and expires_at < time.time():
+        _safe_unlink(path)
+        return None
+    # mtime doubles as the last-access time for LRU eviction
+    os.utime(path, None)
+    return entry.get("value")
+
+def _disk_set(namespace: str, key: str, value, ttl, max_entries: int):
+    ns_dir = os.path.join(CACHE_DIR, namespace)
+    os.makedirs(ns_dir, exist_ok=True)
+    path = _disk_path(namespace, key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    entry = {
+        "expires_at": time.time() + ttl if ttl else None,
+        "value": value
+    }
+    with open(tmp_path, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+
+    entries = [os.path.join(ns_dir, n) for n in os.listdir(ns_dir) if n.endswith(".json")]
+    if len(entries) > max_entries:
+        entries.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for old_path in entries[:len(entries) - max_entries]:
+            _safe_unlink(old_path)
+
+def _safe_unlink(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def cache_get(namespace: str, key: str):
+    """
+    Returns the cached value for 'key' in 'namespace' or None. Counts hits and
+    misses. Cache failures are logged and treated as a miss.
+    """
+    backend = _backend()
+    if backend == "off":
+        return None
+    try:
+        if backend == "redis":
+            value = _redis_get(namespace, key)
+        else:
+            value = _disk_get(namespace, key)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in cache_get in cache.py")
+        return None
+    _count(namespace, "hits" if value is not None else "misses")
+    return value
+
+def cache_set(namespace: str, key: str, value, ttl: int = None, max_entries: int = CACHE_MAX_ENTRIES):
+    """
+    Stores 'value' (JSON-serialisable) under 'key'. 'ttl' is in seconds; None
+    keeps the entry until it is evicted as least recently used.
+    """
+    backend = _backend()
+    if backend == "off":
+        return
+    try:
+        if backend == "redis":
+            _redis_set(namespace, key, value, ttl, max_entries)
+        else:
+            _disk_set(namespace, key, value, ttl, max_entries)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in cache_set in cache.py")
+
+def get_cache_stats(namespace: str) -> dict:
+    """
+    Hit/miss counters and entry count for 'namespace'. When the backend
+    cannot be read the result only says it is unavailable.
+    """
+    backend = _backend()
+    if backend == "redis":
+        try:
+            r = get_redis()
+            hits, misses = r.mget(f"cache:{namespace}:hits", f"cache:{namespace}:misses")
+            entries = r.zcard(f"cache:{namespace}:lru")
+        except Exception as e:
+            log_error_once(e, f"The error: {str(e)}, in get_cache_stats in cache.py")
+            return {"backend": backend, "available": False}
+        return {
+            "backend": backend,
+            "available": True,
+            "hits": int(hits or 0),
+            "misses": int(misses or 0),
+            "entries": entries
+        }
+    with _local_stats_lock:
+        stats = dict(_local_stats.get(namespace, {"hits": 0, "misses": 0}))
+    ns_dir = os.path.join(CACHE_DIR, namespace)
+    entries = len(os.listdir(ns_dir)) if os.path.isdir(ns_dir) else 0
+    return {"backend": backend, "available": True, **stats, "entries": entries}
+
+# ---------------------------------------------------------------------
+# Transcription results for uploaded media, keyed by content hash
+# ---------------------------------------------------------------------
+TRANSCRIPT_CACHE_NAMESPACE = "transcripts"
+TRANSCRIPT_CACHE_TTL = int(os.getenv("TRANSCRIPT_CACHE_TTL", str(30 * 24 * 3600)))  # 30 days
+
+def transcript_cache_key(content_hash: str, settings: dict) -> str:
+    return make_cache_key(content_hash, settings)
+
+def get_cached_transcript(content_hash: str, settings: dict):
+    if not content_hash:
+        return None
+    return cache_get(TRANSCRIPT_CACHE_NAMESPACE, transcript_cache_key(content_hash, settings))
+
+def store_cached_transcript(content_hash: str, settings: dict, transcription: dict):
+    if not content_hash:
+        return
+    cache_set(
+        TRANSCRIPT_CACHE_NAMESPACE,
+        transcript_cache_key(content_hash, settings),
+        transcription,
+        ttl=TRANSCRIPT_CACHE_TTL
+    )
@@ -0,0 +1,78 @@
+import os
+import json
+from dotenv import load_dotenv
+
+from services.redis_client import get_redis
+from services.error_logging import log_error_once
+
+load_dotenv()
+
+# Finished chunks are kept this long so a redelivered or retried job can
+# resume instead of sending every chunk to RunPod again.
+CHUNK_CHECKPOINT_TTL = int(os.getenv("CHUNK_CHECKPOINT_TTL", "86400"))
+
+def checkpoint_key(job_id: str) -> str:
+    return f"transcription:{job_id}:chunks"
+
+def _same_chunk(stored: dict, chunk: dict) -> bool:
+    # Re-segmenting the same file gives the same cuts; anything else is stale.
+    return (
+        abs(stored.get("start", 0.0) - chunk["start"]) < 0.001
+        and abs((stored.get("end") or 0.0) - (chunk["end"] or 0.0)) < 0.001
+    )
+
+def load_checkpoints(job_id: str) -> dict:
+    """
+    Returns {chunk_index: {"chunk", "result"}} for every chunk of 'job_id'
+    that has already been transcribed. Empty without Redis.
+    """
+    r = get_redis()
+    if r is None or not job_id:
+        return {}
+    try:
+        stored = r.hgetall(checkpoint_key(job_id))
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in load_checkpoints in checkpoints.py")
+        return {}
+    return {int(index): json.loads(entry) for index, entry in stored.items()}
+
+def get_checkpoint(job_id: str, index: int, chunk: dict):
+    """
+    Returns the stored RunPod result for chunk 'index' of 'job_id', or None
+    when it has not been transcribed yet (or was cut differently).
+    """
+    r = get_redis()
+    if r is None or not job_id:
+        return None
+    try:
+        entry = r.hget(checkpoint_key(job_id), index)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in get_checkpoint in checkpoints.py")
+        return None
+    if entry is None:
+        return None
+    entry = json.loads(entry)
+    if not _same_chunk(entry["chunk"], chunk):
+        return None
+    return entry["result"]
+
+def save_checkpoint(job_id: str, index: int, chunk: dict, result: dict):
+    r = get_redis()
+    if r is None or not job_id:
+        return
+    try:
+        pipe = r.pipeline()
+        pipe.hset(checkpoint_key(job_id), index, json.dumps({"chunk": chunk, "result": result}))
+        pipe.expire(checkpoint_key(job_id), CHUNK_CHECKPOINT_TTL)
+        pipe.execute()
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in save_checkpoint in checkpoints.py")
+
+def clear_checkpoints(job_id: str):
+    r = get_redis()
+    if r is None or not job_id:
+        return
+    try:
+        r.delete(checkpoint_key(job_id))
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in clear_checkpoints in checkpoints.py")
@@ -0,0 +1,132 @@
+import os
+import re
+import math
+import subprocess
+from dotenv import load_dotenv
+
+from services.runpod_governor import RUNPOD_GLOBAL_CONCURRENCY, endpoint_limit
+from services.error_logging import raise_http_exception_once
+
+load_dotenv()
+
+# "fixed" cuts every SEGMENT_TIME seconds; "silence" cuts near pauses so that
+# every chunk is roughly the same length.
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "fixed")
+SILENCE_NOISE = os.getenv("SILENCE_NOISE", "-30dB")
+SILENCE_MIN_DURATION = float(os.getenv("SILENCE_MIN_DURATION", "0.4"))  # seconds
+SILENCE_SEARCH_WINDOW = float(os.getenv("SILENCE_SEARCH_WINDOW", "30"))  # +/- seconds around an ideal cut
+MIN_CHUNK_SECONDS = float(os.getenv("MIN_CHUNK_SECONDS", "120"))
+MAX_CHUNK_SECONDS = float(os.getenv("MAX_CHUNK_SECONDS", os.getenv("SEGMENT_TIME", "1200")))
+# Number of chunks RunPod can work on at once; defaults to the governor's caps.
+RUNPOD_PARALLELISM = int(os.getenv("RUNPOD_PARALLELISM", "0"))
+DEFAULT_PARALLELISM = 8
+
+DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+SILENCE_START_RE = re.compile(r"silence_start:\s*(-?\d+(?:\.\d+)?)")
+SILENCE_END_RE = re.compile(r"silence_end:\s*(-?\d+(?:\.\d+)?)")
+
+def runpod_parallelism() -> int:
+    if RUNPOD_PARALLELISM > 0:
+        return RUNPOD_PARALLELISM
+    caps = [c for c in (endpoint_limit(os.getenv("RUNPOD_SERVERLESS_URL", "")), RUNPOD_GLOBAL_CONCURRENCY) if c > 0]
+    return min(caps) if caps else DEFAULT_PARALLELISM
+
+def parse_silencedetect_output(stderr: str) -> tuple:
+    """
+    Returns (duration, [(silence_start, silence_end), ...]) from the stderr of
+    an ffmpeg silencedetect run. Duration is None when ffmpeg did not print it.
+    """
+    duration = None
+    match = DURATION_RE.search(stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    silences = []
+    open_start = None
+    for line in stderr.splitlines():
+        start_match = SILENCE_START_RE.search(line)
+        if start_match:
+            open_start = max(0.0, float(start_match.group(1)))
+            continue
+        end_match = SILENCE_END_RE.search(line)
+        if end_match and open_start is not None:
+            silences.append((open_start, float(end_match.group(1))))
+            open_start = None
+    # Trailing silence that runs to the end of the file
+    if open_start is not None and duration is not None:
+        silences.append((open_start, duration))
+    return duration, silences
+
+def detect_silences(input_path: str) -> tuple:
+    """
+    Runs one ffmpeg silencedetect pass over the audio of 'input_path'.
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", input_path,
+        "-vn",
+        "-af", f"silencedetect=noise={SILENCE_NOISE}:d={SILENCE_MIN_DURATION}",
+        "-f", "null", "-"
+    ]
+    try:
+        completed = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        raise_http_exception_once(
+            e,
+            500,
+            f"FFmpeg silence detection error: {str(e)}",
+            f"The error: FFmpeg silence detection error: {str(e)}, in detect_silences in chunking.py"
+        )
+    return parse_silencedetect_output(completed.stderr)
+
+def target_chunk_count(duration: float, parallelism: int) -> int:
+    """
+    Enough chunks that none is longer than MAX_CHUNK_SECONDS, as many as
+    RunPod can run at once, rounded up to whole waves of 'parallelism', but
+    none shorter than MIN_CHUNK_SECONDS.
+    """
+    parallelism = max(1, parallelism)
+    fewest = max(1, math.ceil(duration / MAX_CHUNK_SECONDS))
+    most = max(fewest, math.floor(duration / MIN_CHUNK_SECONDS))
+    count = max(fewest, min(parallelism, most))
+    waves = math.ceil(count / parallelism)
+    return min(most, waves * parallelism) if count > parallelism else count
+
+def plan_cut_points(duration: float, silences: list, chunk_count: int) -> list:
+    """
+    Places chunk_count - 1 cuts at even intervals, each moved to the middle
+    of the nearest silence within SILENCE_SEARCH_WINDOW seconds.
+    """
+    if chunk_count <= 1:
+        return []
+    midpoints = [(start + end) / 2 for start, end in silences]
+    cuts = []
+    previous = 0.0
+    for k in range(1, chunk_count):
+        ideal = duration * k / chunk_count
+        candidates = [
+            m for m in midpoints
+            if abs(m - ideal) <= SILENCE_SEARCH_WINDOW and m > previous
+        ]
+        cut = min(candidates, key=lambda m: abs(m - ideal)) if candidates else ideal
+        if cut <= previous or cut >= duration:
+            continue
+        cuts.append(round(cut, 3))
+        previous = cut
+    return cuts
+
+def plan_silence_cuts(input_path: str, parallelism: int = None) -> list:
+    """
+    Returns the cut times (seconds) for silence-aligned chunking of 'input_path'.
+    """
+    duration, silences = detect_silences(input_path)
+    if not duration:
+        raise_http_exception_once(
+            Exception("Unknown duration"),
+            500,
+            "Could not determine media duration for silence-aligned chunking.",
+            f"The error: ffmpeg reported no duration for {input_path}, in plan_silence_cuts in chunking.py"
+        )
+    count = target_chunk_count(duration, parallelism or runpod_parallelism())
+    return plan_cut_points(duration, silences, count)
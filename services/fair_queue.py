@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import asyncio
+from dotenv import load_dotenv
+
+from celeryapp import celery
+from services.redis_client import get_redis
+from services.error_logging import log_error_once
+
+load_dotenv()
+
+# Jobs released to Celery at once, across all customers (0 = no limit).
+# Set it to roughly what the worker fleet can run; everything beyond that
+# waits here and is released in weighted-fair order.
+FAIR_QUEUE_DISPATCH_LIMIT = int(os.getenv("FAIR_QUEUE_DISPATCH_LIMIT", "0"))
+# A dispatched job whose completion was never reported frees its slot after this.
+FAIR_QUEUE_LEASE = int(os.getenv("FAIR_QUEUE_LEASE", str(4 * 3600)))
+# Cost (seconds of media) assumed for jobs whose duration is unknown.
+FAIR_QUEUE_DEFAULT_COST = float(os.getenv("FAIR_QUEUE_DEFAULT_COST", "600"))
+FAIR_QUEUE_SCAN = 200  # parked jobs looked at per dispatch
+# Each API process also dispatches on this tick, so jobs parked after a
+# failed send or behind an expired lease do not wait for the next submit.
+FAIR_QUEUE_TICK_INTERVAL = float(os.getenv("FAIR_QUEUE_TICK_INTERVAL", "5"))
+
+PENDING_KEY = "wfq:pending"
+JOBS_KEY = "wfq:jobs"
+DISPATCHED_KEY = "wfq:dispatched"
+VIRTUAL_TIME_KEY = "wfq:vtime"
+
+# Weighted fair queuing: a job's virtual finish time is
+# max(virtual time, the customer's last finish time) + cost / weight.
+PARK_SCRIPT = """
+local vtime = tonumber(redis.call('GET', KEYS[3]) or '0')
+local last = tonumber(redis.call('GET', KEYS[4]) or '0')
+local finish = math.max(vtime, last) + tonumber(ARGV[3])
+redis.call('SET', KEYS[4], tostring(finish))
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[1], finish, ARGV[1])
+return tostring(finish)
+"""
+
+# Pops the parked job with the smallest finish time whose customer is under
+# its concurrency cap, if the fleet-wide limit allows another job.
+DISPATCH_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+local limit = tonumber(ARGV[3])
+if limit > 0 and redis.call('ZCARD', KEYS[3]) >= limit then
+    return false
+end
+local candidates = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[4]) - 1, 'WITHSCORES')
+for i = 1, #candidates, 2 do
+    local job_id = candidates[i]
+    local spec = redis.call('HGET', KEYS[2], job_id)
+    if not spec then
+        redis.call('ZREM', KEYS[1], job_id)
+    else
+        local job = cjson.decode(spec)
+        local running = 'wfq:running:' .. job['tenant']
+        redis.call('ZREMRANGEBYSCORE', running, '-inf', now)
+        local cap = tonumber(job['max_concurrency'])
+        if cap <= 0 or redis.call('ZCARD', running) < cap then
+            redis.call('ZREM', KEYS[1], job_id)
+            redis.call('HDEL', KEYS[2], job_id)
+            redis.call('ZADD', running, ARGV[2], job_id)
+            redis.call('ZADD', KEYS[3], ARGV[2], job_id)
+            redis.call('SET', 'wfq:owner:' .. job_id, job['tenant'], 'EX', ARGV[5])
+            -- a capped customer's older job may go out after later ones:
+            -- virtual time never moves backwards
+            local vtime = tonumber(redis.call('GET', KEYS[4]) or '0')
+            redis.call('SET', KEYS[4], tostring(math.max(vtime, tonumber(candidates[i + 1]))))
+            return spec
+        end
+    end
+end
+return false
+"""
+
+RELEASE_SCRIPT = """
+local tenant = redis.call('GET', 'wfq:owner:' .. ARGV[1])
+redis.call('ZREM', KEYS[1], ARGV[1])
+if tenant then
+    redis.call('ZREM', 'wfq:running:' .. tenant, ARGV[1])
+    redis.call('DEL', 'wfq:owner:' .. ARGV[1])
+end
+return 1
+"""
+
+# Takes one of the customer's running slots if it is under its cap.
+CLAIM_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[1]))
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[4]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+return 1
+"""
+
+def tenant_running_key(tenant_name: str) -> str:
+    return f"wfq:running:{tenant_name}"
+
+def tenant_finish_key(tenant_name: str) -> str:
+    return f"wfq:finish:{tenant_name}"
+
+def send_job(spec: dict):
+    celery.send_task(
+        spec["task"], args=spec["args"], kwargs=spec["kwargs"],
+        task_id=spec["task_id"], **spec["options"]
+    )
+
+def submit_fair(task_name: str, args: list, kwargs: dict, options: dict, task_id: str,
+                tenant: dict = None, cost: float = None):
+    """
+    Parks the job in the customer's fair queue and dispatches whatever may
+    run now. 'cost' is the media duration in seconds. Without Redis (or a
+    customer) the job is sent to Celery straight away.
+    """
+    spec = {
+        "task": task_name,
+        "args": list(args),
+        "kwargs": kwargs,
+        "options": options or {},
+        "task_id": task_id
+    }
+    r = get_redis()
+    if r is None or tenant is None:
+        send_job(spec)
+        return
+    spec["tenant"] = tenant["name"]
+    spec["max_concurrency"] = tenant["max_concurrency"]
+    r.eval(
+        PARK_SCRIPT, 4, PENDING_KEY, JOBS_KEY, VIRTUAL_TIME_KEY, tenant_finish_key(tenant["name"]),
+        task_id, json.dumps(spec), (cost or FAIR_QUEUE_DEFAULT_COST) / max(tenant["weight"], 0.001)
+    )
+    dispatch_ready()
+
+def dispatch_ready() -> int:
+    """
+    Sends parked jobs to Celery in virtual-finish-time order until the
+    fleet limit is reached or every remaining job's customer is at its
+    cap. Called on submit and whenever a job finishes. Returns the count.
+    """
+    r = get_redis()
+    if r is None:
+        return 0
+    sent = 0
+    while True:
+        now = time.time()
+        try:
+            raw = r.eval(
+                DISPATCH_SCRIPT, 4, PENDING_KEY, JOBS_KEY, DISPATCHED_KEY, VIRTUAL_TIME_KEY,
+                now, now + FAIR_QUEUE_LEASE, FAIR_QUEUE_DISPATCH_LIMIT, FAIR_QUEUE_SCAN, FAIR_QUEUE_LEASE
+            )
+        except Exception as e:
+            log_error_once(e, f"The error: {str(e)}, in dispatch_ready in fair_queue.py")
+            return sent
+        if not raw:
+            return sent
+        spec = json.loads(raw)
+        try:
+            send_job(spec)
+            sent += 1
+        except Exception as e:
+            log_error_once(e, f"The error: {str(e)}, in dispatch_ready in fair_queue.py")
+            # back to the front of the queue for the next dispatch
+            release_dispatched(spec["task_id"])
+            r.hset(JOBS_KEY, spec["task_id"], raw)
+            r.zadd(PENDING_KEY, {spec["task_id"]: 0})
+            return sent
+
+def release_dispatched(task_id: str):
+    """
+    Frees the fleet and customer slots held by a finished job.
+    """
+    r = get_redis()
+    if r is None or not task_id:
+        return
+    try:
+        r.eval(RELEASE_SCRIPT, 1, DISPATCHED_KEY, task_id)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in release_dispatched in fair_queue.py")
+
+def claim_running_slot(tenant: dict, slot_id: str) -> bool:
+    """
+    Counts work done outside the fair queue (sync requests) against the
+    customer's max_concurrency. Returns False when the customer is at its
+    cap; otherwise the slot is held until release_running_slot.
+    """
+    r = get_redis()
+    if r is None or tenant is None or tenant["max_concurrency"] <= 0:
+        return True
+    now = time.time()
+    try:
+        return bool(r.eval(
+            CLAIM_SCRIPT, 1, tenant_running_key(tenant["name"]),
+            now, now + FAIR_QUEUE_LEASE, slot_id, tenant["max_concurrency"]
+        ))
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in claim_running_slot in fair_queue.py")
+        return True
+
+def release_running_slot(tenant: dict, slot_id: str):
+    """
+    Frees a slot taken with claim_running_slot and lets parked jobs use it.
+    """
+    r = get_redis()
+    if r is None or tenant is None or tenant["max_concurrency"] <= 0:
+        return
+    try:
+        r.zrem(tenant_running_key(tenant["name"]), slot_id)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in release_running_slot in fair_queue.py")
+        return
+    dispatch_ready()
+
+async def run_dispatch_ticker(interval: float = FAIR_QUEUE_TICK_INTERVAL):
+    """
+    Calls dispatch_ready every 'interval' seconds until cancelled. The
+    dispatch script is atomic, so every API process can run one.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(dispatch_ready)
+        except Exception as e:
+            log_error_once(e, f"The error: {str(e)}, in run_dispatch_ticker in fair_queue.py")
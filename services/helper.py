@@ -1,22 +1,42 @@
 import os
+import re
 import time
-import json
+import csv
 import glob
-import requests
+import json
+import hashlib
 import subprocess
 import asyncio
 import uuid
-import shutil
 from fastapi import UploadFile
 from dotenv import load_dotenv
 
 from services.error_logging import log_error_once, raise_http_exception_once
+from services.runpod_client import get_transcription
+from services.chunking import CHUNKING_MODE, plan_silence_cuts
+from services.stitching import reconcile_overlap
+from services.metrics import observe
+from services.tenants import get_tenant
+from services.checkpoints import clear_checkpoints, get_checkpoint, save_checkpoint
 
 load_dotenv()
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB per read/write
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(4 * 1024 ** 3)))  # 4 GiB
+SEGMENT_TIME = int(os.getenv("SEGMENT_TIME", "1200"))  # seconds per chunk
+CHUNK_OVERLAP = float(os.getenv("CHUNK_OVERLAP", "0"))  # seconds shared by neighbouring chunks, e.g. 2-5
+# Send chunks to RunPod while ffmpeg is still segmenting (not used with overlap)
+PIPELINED_SEGMENTATION = os.getenv("PIPELINED_SEGMENTATION", "1") == "1"
+# Re-encode chunks to low-bitrate mono Opus in the segmenting pass, so RunPod
+# fetches a fraction of the bytes. Costs CPU on the worker.
+NORMALIZE_AUDIO = os.getenv("NORMALIZE_AUDIO", "0") == "1"
+NORMALIZE_SAMPLE_RATE = int(os.getenv("NORMALIZE_SAMPLE_RATE", "16000"))
+NORMALIZE_BITRATE = os.getenv("NORMALIZE_BITRATE", "24k")
+NORMALIZE_TIME_METRIC = "audio_normalize_seconds"
+
 def safe_remove(path: str):
     """
     Safely removes a file if it exists.
@@ -24,16 +44,72 @@ def safe_remove(path: str):
     if os.path.exists(path):
         os.remove(path)
 
-def save_upload_file(file: UploadFile) -> str:
-    temp_file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(temp_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return temp_file_path
+def build_upload_path(filename: str) -> str:
+    """
+    Returns a unique path inside UPLOAD_DIR, keeping only the (sanitised)
+    extension of the client's file name.
+    """
+    _, ext = os.path.splitext(os.path.basename(filename or ""))
+    ext = re.sub(r"[^A-Za-z0-9.]", "", ext)[:10]
+    return os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{ext}")
+
+def _write_upload_chunk(buffer, hasher, chunk: bytes):
+    buffer.write(chunk)
+    hasher.update(chunk)
+
+async def save_upload_file(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> dict:
+    """
+    Streams 'file' to a uniquely named file in UPLOAD_DIR in fixed-size chunks.
+    Reads and writes are pushed to the threadpool so the event loop stays free
+    while large uploads are stored. Returns the path, the SHA-256 of the
+    content and the number of bytes written.
+    """
+    file_path = build_upload_path(file.filename)
+    hasher = hashlib.sha256()
+    size_bytes = 0
+    buffer = await asyncio.to_thread(open, file_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size_bytes += len(chunk)
+            if size_bytes > max_bytes:
+                raise_http_exception_once(
+                    Exception("Upload too large"),
+                    413,
+                    f"File is too large. The maximum upload size is {max_bytes} bytes.",
+                    f"The error: Upload exceeded {max_bytes} bytes, in save_upload_file in helper.py"
+                )
+            await asyncio.to_thread(_write_upload_chunk, buffer, hasher, chunk)
+    except BaseException:
+        await asyncio.to_thread(buffer.close)
+        safe_remove(file_path)
+        raise
+    await asyncio.to_thread(buffer.close)
+
+    return {
+        "file_path": file_path,
+        "content_hash": hasher.hexdigest(),
+        "size_bytes": size_bytes
+    }
+
+def get_transcription_settings(segment_time: int = SEGMENT_TIME, chunking: str = CHUNKING_MODE,
+                               overlap: float = CHUNK_OVERLAP, normalize: bool = NORMALIZE_AUDIO) -> dict:
+    """
+    Settings that change the transcript produced for the same media.
+    Used as part of the transcription cache key.
+    """
+    settings = {"segment_time": segment_time, "chunking": chunking, "overlap": overlap}
+    if normalize:
+        # only present when on, so existing cache keys stay valid
+        settings["normalize"] = True
+    return settings
 
 def check_api_key(api_key: str) -> bool:
     try:
-        actual_api_key = os.getenv('API_KEY')
-        if api_key and api_key != actual_api_key:
+        # API_KEY or any key configured in API_KEYS
+        if api_key and get_tenant(api_key) is None:
             return False
         return True
     except Exception as e:
@@ -41,226 +117,606 @@ def check_api_key(api_key: str) -> bool:
         log_error_once(e, f"The error: {str(e)}, in check_api_key in helper.py")
         return False
 
-def get_transcription(audio_url: str) -> dict:
-    endpoint_url = os.getenv('RUNPOD_SERVERLESS_URL')
-    runpod_api_key = os.getenv('RUNPOD_AUTH_TOKEN')
-    if not endpoint_url or not runpod_api_key:
+def build_chunk_url(file_path: str) -> str:
+    if not os.path.exists(file_path):
         raise_http_exception_once(
-            Exception("Missing env keys"),
-            500,
-            "Endpoint URL or RunPod API key not found in environment variables.",
-            "The error: Endpoint URL or RunPod API key not found in environment variables, in get_transcription in helper.py"
+            Exception("Chunk missing"),
+            400,
+            f"Chunk not found: {file_path}",
+            f"The error: Chunk not found: {file_path}, in build_chunk_url in helper.py"
         )
 
-    headers = {
-        'authorization': runpod_api_key,
-        'content-type': 'application/json',
-    }
-
-    payload = json.dumps({"input": {"audio": audio_url}})
-
-    # 1) Initiate the transcription job
-    try:
-        response = requests.post(f"{endpoint_url}/run", headers=headers, data=payload, timeout=30)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
+    domain_url = os.getenv('DOMAIN_URL')
+    if not domain_url:
         raise_http_exception_once(
-            e,
+            Exception("Missing DOMAIN_URL"),
             500,
-            f"Failed to initiate transcription job: {e}",
-            f"The error: {str(e)}, in get_transcription in helper.py"
+            "DOMAIN_URL is not set",
+            "The error: DOMAIN_URL is not set, in build_chunk_url in helper.py"
         )
 
-    # 2) Parse job initiation response
-    try:
-        data = response.json()
-    except ValueError as e:
-        raise_http_exception_once(
-            e,
-            500,
-            f"Failed to parse initiation response as JSON: {e}",
-            f"The error: {str(e)}, in get_transcription in helper.py"
-        )
+    print(f"{domain_url}/{file_path}","DOMAIN URL")
+    return f"{domain_url}/{file_path}"
 
-    if "id" not in data:
-        raise_http_exception_once(
-            Exception("No 'id' in response"),
-            500,
-            "Response JSON does not contain 'id' field - cannot track job.",
-            "The error: Response JSON does not contain 'id' field - cannot track job, in get_transcription in helper.py"
-        )
+def file_size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
 
-    job_id = data["id"]
-    job_finished = False
-    result = None
+def audio_codec_args(normalize: bool = NORMALIZE_AUDIO) -> list:
+    """
+    ffmpeg output options for chunk audio: stream copy, or 16 kHz mono Opus.
+    """
+    if not normalize:
+        return ["-acodec", "copy"]
+    return [
+        "-ac", "1",
+        "-ar", str(NORMALIZE_SAMPLE_RATE),
+        "-acodec", "libopus",
+        "-b:a", NORMALIZE_BITRATE,
+        "-application", "voip"
+    ]
 
-    # 3) Poll the status until "COMPLETED"
-    while not job_finished:
-        time.sleep(1)
-        try:
-            status_response = requests.get(f"{endpoint_url}/status/{job_id}", headers=headers)
-            status_response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            raise_http_exception_once(
-                e,
-                500,
-                f"Error while polling job status: {e}",
-                f"The error: {str(e)}, in get_transcription in helper.py"
-            )
+def chunk_extension(normalize: bool = NORMALIZE_AUDIO) -> str:
+    return ".opus" if normalize else ".aac"
+
+def parse_segment_list(list_path: str) -> list:
+    """
+    Parses an ffmpeg CSV segment list ("name,start,end" per line) into
+    [{"path", "start", "end", "bytes"}, ...]. Entry names are relative to the
+    list's directory; start/end are the real cut times in the source, in seconds.
+    """
+    chunk_dir = os.path.dirname(list_path)
+    chunks = []
+    with open(list_path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            chunk_path = os.path.join(chunk_dir, row[0])
+            chunks.append({
+                "path": chunk_path,
+                "start": float(row[1]),
+                "end": float(row[2]),
+                "bytes": file_size(chunk_path)
+            })
+    return chunks
+
+def merge_chunk_transcripts(results: list, chunks: list) -> list:
+    """
+    Shifts each chunk's segments by the chunk's real start time and
+    concatenates them in order. Where neighbouring chunks overlap, the
+    duplicated speech is reconciled (see stitching.reconcile_overlap).
+    """
+    merged_segments = []
+    previous_chunk = None
+    for rdict, chunk in zip(results, chunks):
+        offset = chunk["start"]
+        shifted = [
+            dict(seg, start=seg["start"] + offset, end=seg["end"] + offset)
+            for seg in rdict.get("transcript", [])
+        ]
+        if previous_chunk is not None and previous_chunk["end"] > chunk["start"]:
+            merged_segments = reconcile_overlap(merged_segments, shifted, chunk["start"], previous_chunk["end"])
+        else:
+            merged_segments.extend(shifted)
+        previous_chunk = chunk
+    return merged_segments
 
+class ChunkProgress:
+    """
+    Tracks finished chunks of one transcription and reports
+    (progress, partial_transcript, chunk_segments) to 'on_progress' after
+    each of them; chunk_segments are the new chunk's offset segments.
+    With a 'job_id', finished chunks are checkpointed so a redelivered job
+    only transcribes the ones still missing.
+    """
+    def __init__(self, on_progress=None, job_id: str = None):
+        self.on_progress = on_progress
+        self.job_id = job_id
+        self.chunks = []
+        self.results = {}
+        self.total_chunks = None
+
+    def add_chunk(self, chunk: dict) -> int:
+        self.chunks.append(chunk)
+        return len(self.chunks) - 1
+
+    def segmentation_done(self):
+        self.total_chunks = len(self.chunks)
+        self.report([])
+
+    def chunk_done(self, index: int, result: dict):
+        self.results[index] = result
+        self.report(merge_chunk_transcripts([result], [self.chunks[index]]))
+
+    def partial_transcript(self) -> list:
+        done = sorted(self.results)
+        return merge_chunk_transcripts([self.results[i] for i in done], [self.chunks[i] for i in done])
+
+    def report(self, chunk_segments: list):
+        if self.on_progress is None:
+            return
+        progress = {
+            "completed_chunks": len(self.results),
+            "total_chunks": self.total_chunks,
+            "percent": round(100 * len(self.results) / self.total_chunks, 1) if self.total_chunks else None
+        }
         try:
-            result = status_response.json()
-        except ValueError as e:
-            raise_http_exception_once(
-                e,
-                500,
-                f"Failed to parse status response as JSON: {e}",
-                f"The error: {str(e)}, in get_transcription in helper.py"
-            )
+            self.on_progress(progress, self.partial_transcript(), chunk_segments)
+        except Exception as e:
+            log_error_once(e, f"The error: {str(e)}, in ChunkProgress.report in helper.py")
 
-        if result.get("status") == "FAILED":
-            raise_http_exception_once(
-                Exception("Job failed on server"),
-                500,
-                "Transcription job failed on the server side.",
-                "The error: Transcription job failed on the server side, in get_transcription in helper.py"
-            )
+async def cancel_all(tasks: list):
+    """
+    Cancels 'tasks' and waits until they have unwound, so nothing is left
+    running on the worker's long-lived loop (cancelled RunPod calls cancel
+    their jobs on the way out).
+    """
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
-        job_finished = (result.get("status") == "COMPLETED")
+async def gather_or_cancel(coros: list) -> list:
+    """
+    asyncio.gather that cancels the remaining coroutines as soon as one fails.
+    """
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        await cancel_all(tasks)
+        raise
+
+async def transcribe_tracked_chunk(progress: ChunkProgress, index: int) -> dict:
+    chunk = progress.chunks[index]
+    result = get_checkpoint(progress.job_id, index, chunk)
+    if result is None:
+        result = await get_transcription(build_chunk_url(chunk["path"]))
+        save_checkpoint(progress.job_id, index, chunk, result)
+    progress.chunk_done(index, result)
+    return result
+
+def overlapping_segment_transcode(input_path: str, cut_points: list, overlap: float,
+                                  normalize: bool = NORMALIZE_AUDIO) -> list:
+    """
+    Writes one chunk per [cut_i, cut_i+1 + overlap] window with a single ffmpeg
+    process (one demux pass, one output per chunk, stream copy). Starts are
+    the requested cut times; with stream copy the first packet may land up
+    to one audio frame later.
+    """
+    base, _ = os.path.splitext(input_path)
+    bounds = [0.0] + list(cut_points)
+    cmd = ["ffmpeg", "-i", input_path]
+    chunks = []
+    for i, start in enumerate(bounds):
+        chunk_path = f"{base}_chunk_{i:03d}{chunk_extension(normalize)}"
+        output_args = ["-map", "0:a:0", "-vn", *audio_codec_args(normalize), "-ss", f"{start:.3f}"]
+        end = None
+        if i + 1 < len(bounds):
+            end = bounds[i + 1] + overlap
+            output_args += ["-to", f"{end:.3f}"]
+        cmd += output_args + [chunk_path]
+        chunks.append({"path": chunk_path, "start": start, "end": end})
+    cmd.append("-y")
 
-    # 4) Extract final segments
-    if "output" not in result or "segments" not in result["output"]:
+    try:
+        subprocess.run(cmd, check=True)
+    except subprocess.CalledProcessError as e:
         raise_http_exception_once(
-            Exception("Missing 'segments' in response"),
+            e,
             500,
-            "Transcription result does not contain expected 'segments' field.",
-            "The error: Transcription result does not contain expected 'segments' field, in get_transcription in helper.py"
+            f"FFmpeg single-pass error: {str(e)}",
+            f"The error: FFmpeg single-pass error: {str(e)}, in overlapping_segment_transcode in helper.py"
         )
 
-    segments = result["output"]["segments"]
-    transcript_data = [
-        {"text": seg["text"], "start": seg["start"], "end": seg["end"]}
-        for seg in segments
-    ]
-    detected_lang = result["output"].get("detected_language", None)
+    if chunks[-1]["end"] is None:
+        chunks[-1]["end"] = get_audio_duration(input_path)
+    for chunk in chunks:
+        chunk["bytes"] = file_size(chunk["path"])
+    return chunks
 
-    return {
-        "transcript": transcript_data,
-        "detected_language": detected_lang,
-        "is_runpod": True,
-        "status_code": 200
-    }
+def single_pass_segment_transcode(input_path: str, segment_time: int = 1200, segment_times: list = None,
+                                  overlap: float = 0, normalize: bool = NORMALIZE_AUDIO) -> list:
+    """
+    Splits the audio of 'input_path' into ~segment_time chunks (or at the
+    given 'segment_times' cut points) in one ffmpeg pass (stream copy) and
+    returns [{"path", "start", "end"}, ...] with the exact chunk boundaries
+    ffmpeg chose, read from its segment list. With 'overlap' > 0 every chunk
+    also covers the first 'overlap' seconds of the next one. With
+    'normalize' the chunks are re-encoded to mono Opus in the same pass.
+    """
+    if overlap > 0:
+        if segment_times is None:
+            duration = get_audio_duration(input_path)
+            segment_times = [t for t in range(segment_time, int(duration), segment_time)]
+        return overlapping_segment_transcode(input_path, segment_times, overlap, normalize)
 
-def build_chunk_url(file_path: str) -> str:
-    if not os.path.exists(file_path):
+    base, _ = os.path.splitext(input_path)
+    chunk_pattern = f"{base}_chunk_%03d{chunk_extension(normalize)}"
+    list_path = f"{base}_chunks.csv"
+    cmd = build_segment_command(input_path, chunk_pattern, list_path, segment_time, segment_times, normalize)
+
+    try:
+        subprocess.run(cmd, check=True)
+        chunks = parse_segment_list(list_path)
+    except (subprocess.CalledProcessError, OSError) as e:
         raise_http_exception_once(
-            Exception("Chunk missing"),
-            400,
-            f"Chunk not found: {file_path}",
-            f"The error: Chunk not found: {file_path}, in build_chunk_url in helper.py"
+            e,
+            500,
+            f"FFmpeg single-pass error: {str(e)}",
+            f"The error: FFmpeg single-pass error: {str(e)}, in single_pass_segment_transcode in helper.py"
         )
+    finally:
+        safe_remove(list_path)
 
-    domain_url = os.getenv('DOMAIN_URL')
-    if not domain_url:
+    if not chunks:
         raise_http_exception_once(
-            Exception("Missing DOMAIN_URL"),
+            Exception("No chunk files"),
             500,
-            "DOMAIN_URL is not set",
-            "The error: DOMAIN_URL is not set, in build_chunk_url in helper.py"
+            "No chunk files created by FFmpeg.",
+            "The error: No chunk files created by FFmpeg, in single_pass_segment_transcode in helper.py"
         )
 
-    print(f"{domain_url}/{file_path}","DOMAIN URL")
-    return f"{domain_url}/{file_path}"
+    return chunks
 
-def single_pass_segment_transcode(input_path: str, segment_time: int = 1200) -> list:
-    base, _ = os.path.splitext(input_path)
-    chunk_pattern = f"{base}_chunk_%03d.aac"
-
-    cmd = [
+def build_segment_command(input_path: str, chunk_pattern: str, list_target: str,
+                          segment_time: int = 1200, segment_times: list = None,
+                          normalize: bool = NORMALIZE_AUDIO) -> list:
+    """
+    ffmpeg command that drops video and cuts the audio (stream copy, or
+    mono Opus with 'normalize') into chunks, writing a CSV segment list to
+    'list_target' (a path or pipe:1).
+    """
+    if segment_times:
+        split_args = ["-segment_times", ",".join(f"{t:.3f}" for t in segment_times)]
+    else:
+        split_args = ["-segment_time", str(segment_time)]
+    return [
         "ffmpeg",
         "-i", input_path,
         "-vn",
-        "-acodec", "copy",
+        *audio_codec_args(normalize),
         "-f", "segment",
-        "-segment_time", str(segment_time),
+        *split_args,
+        "-segment_list", list_target,
+        "-segment_list_type", "csv",
         "-reset_timestamps", "1",
         chunk_pattern,
         "-y"
     ]
 
+async def _feed_stdin(proc, body):
+    """
+    Writes every block of the async iterator 'body' to ffmpeg's stdin, then
+    closes it. Stops quietly if ffmpeg has already exited.
+    """
     try:
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
+        async for data in body:
+            if not data:
+                continue
+            proc.stdin.write(data)
+            await proc.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        try:
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+async def stream_segment_transcode(input_path: str, segment_time: int = 1200, segment_times: list = None,
+                                   normalize: bool = NORMALIZE_AUDIO, body=None):
+    """
+    Async generator version of single_pass_segment_transcode: ffmpeg writes
+    its segment list to stdout, and each {"path", "start", "end"} chunk is
+    yielded as soon as ffmpeg has finished writing it. With 'body' (an async
+    iterator of bytes, e.g. a request body) ffmpeg reads the media from its
+    stdin instead, and 'input_path' only names the chunks.
+    """
+    base, _ = os.path.splitext(input_path)
+    chunk_pattern = f"{base}_chunk_%03d{chunk_extension(normalize)}"
+    chunk_dir = os.path.dirname(chunk_pattern)
+    cmd = build_segment_command(
+        "pipe:0" if body is not None else input_path, chunk_pattern, "pipe:1",
+        segment_time, segment_times, normalize
+    )
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if body is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE
+    )
+    feeder = asyncio.ensure_future(_feed_stdin(proc, body)) if body is not None else None
+    emitted = 0
+    try:
+        async for raw_line in proc.stdout:
+            row = next(csv.reader([raw_line.decode().strip()]), [])
+            if len(row) < 3:
+                continue
+            emitted += 1
+            chunk_path = os.path.join(chunk_dir, row[0])
+            yield {
+                "path": chunk_path,
+                "start": float(row[1]),
+                "end": float(row[2]),
+                "bytes": file_size(chunk_path)
+            }
+        if feeder is not None:
+            # re-raises errors from the body, e.g. an upload that is too large
+            await feeder
+        returncode = await proc.wait()
+    finally:
+        if feeder is not None and not feeder.done():
+            feeder.cancel()
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+    if returncode != 0:
         raise_http_exception_once(
-            e,
+            subprocess.CalledProcessError(returncode, cmd),
             500,
-            f"FFmpeg single-pass error: {str(e)}",
-            f"The error: FFmpeg single-pass error: {str(e)}, in single_pass_segment_transcode in helper.py"
+            f"FFmpeg single-pass error: exit status {returncode}",
+            f"The error: FFmpeg single-pass error: exit status {returncode}, in stream_segment_transcode in helper.py"
         )
-
-    chunk_files = glob.glob(f"{base}_chunk_*.aac")
-    chunk_files.sort()
-    if not chunk_files:
+    if not emitted:
         raise_http_exception_once(
             Exception("No chunk files"),
             500,
             "No chunk files created by FFmpeg.",
-            "The error: No chunk files created by FFmpeg, in single_pass_segment_transcode in helper.py"
+            "The error: No chunk files created by FFmpeg, in stream_segment_transcode in helper.py"
         )
 
-    return chunk_files
-
-async def single_pass_chunk_and_transcribe(file_path: str, segment_time: int = 1200) -> dict:
-    chunk_start = time.time()
-    chunk_files = single_pass_segment_transcode(file_path, segment_time=segment_time)
-    chunk_end = time.time()
-    chunk_time = chunk_end - chunk_start
+async def ingest_stream_to_chunks(body, segment_time: int = SEGMENT_TIME, normalize: bool = NORMALIZE_AUDIO,
+                                  max_bytes: int = MAX_UPLOAD_BYTES) -> dict:
+    """
+    Pipes 'body' (an async iterator of bytes, e.g. request.stream()) into
+    ffmpeg while it is still arriving, so upload and audio extraction
+    overlap and only the audio chunks are written to disk. Uses fixed-length
+    chunks without overlap, since silence detection and overlapping cuts
+    need the whole file. Returns the chunks, the SHA-256 of the body, its
+    size and the time spent.
+    """
+    base_path = build_upload_path("")
+    hasher = hashlib.sha256()
+    received = {"bytes": 0}
+
+    async def metered_body():
+        async for data in body:
+            received["bytes"] += len(data)
+            if received["bytes"] > max_bytes:
+                raise_http_exception_once(
+                    Exception("Upload too large"),
+                    413,
+                    f"File is too large. The maximum upload size is {max_bytes} bytes.",
+                    f"The error: Upload exceeded {max_bytes} bytes, in ingest_stream_to_chunks in helper.py"
+                )
+            hasher.update(data)
+            yield data
+
+    ingest_start = time.time()
+    chunks = []
+    try:
+        async for chunk in stream_segment_transcode(base_path, segment_time, None, normalize, body=metered_body()):
+            chunks.append(chunk)
+    except BaseException:
+        # includes the segment ffmpeg was still writing
+        for path in glob.glob(f"{base_path}_chunk_*"):
+            safe_remove(path)
+        raise
 
-    transcription_start = time.time()
-    if len(chunk_files) == 1:
-        chunk_url = build_chunk_url(chunk_files[0])
-        trans_result = get_transcription(chunk_url)
-        transcription_end = time.time()
-        transcription_time = transcription_end - transcription_start
-
-        return {
-            "transcript": trans_result["transcript"],
-            "detected_language": trans_result.get("detected_language"),
-            "is_runpod": True,
-            "status_code": 200,
-            "chunk_time": chunk_time,
-            "transcription_time": transcription_time
-        }
+    return {
+        "chunks": chunks,
+        "content_hash": hasher.hexdigest(),
+        "size_bytes": received["bytes"],
+        "duration": chunks[-1]["end"],
+        "ingest_time": time.time() - ingest_start
+    }
 
-    # multiple chunks => run in parallel
+async def pipelined_chunk_and_transcribe(file_path: str, segment_time: int = 1200, segment_times: list = None,
+                                         progress: ChunkProgress = None, normalize: bool = NORMALIZE_AUDIO,
+                                         body=None) -> tuple:
+    """
+    Dispatches every chunk to RunPod the moment ffmpeg emits it, so
+    segmentation overlaps transcription. 'body' is passed on to
+    stream_segment_transcode. Returns (chunks, results, chunk_time).
+    """
+    progress = progress or ChunkProgress()
+    chunk_start = time.time()
     tasks = []
-    for i, chunk_path in enumerate(chunk_files):
-        tasks.append(asyncio.to_thread(get_transcription, build_chunk_url(chunk_path)))
+    try:
+        async for chunk in stream_segment_transcode(file_path, segment_time, segment_times, normalize, body=body):
+            index = progress.add_chunk(chunk)
+            tasks.append(asyncio.ensure_future(transcribe_tracked_chunk(progress, index)))
+        chunk_time = time.time() - chunk_start
+        progress.segmentation_done()
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        await cancel_all(tasks)
+        for chunk in progress.chunks:
+            safe_remove(chunk["path"])
+        raise
+    return progress.chunks, results, chunk_time
+
+async def single_pass_chunk_and_transcribe(file_path: str, segment_time: int = 1200, chunking: str = CHUNKING_MODE,
+                                           overlap: float = CHUNK_OVERLAP,
+                                           pipelined: bool = PIPELINED_SEGMENTATION,
+                                           on_progress=None, job_id: str = None,
+                                           normalize: bool = NORMALIZE_AUDIO) -> dict:
+    """
+    Segments 'file_path', transcribes every chunk on RunPod and merges the
+    results. 'on_progress(progress, partial_transcript, chunk_segments)' is
+    called whenever a chunk finishes. Chunks already checkpointed for
+    'job_id' are not sent to RunPod again. With 'normalize' the result
+    includes a "normalization" report.
+    """
+    progress = ChunkProgress(on_progress, job_id)
+    source_bytes = source_audio_bytes(file_path) if normalize else None
+    chunk_start = time.time()
+    # "silence" mode: one silencedetect pass picks cut points near pauses
+    segment_times = plan_silence_cuts(file_path) if chunking == "silence" else None
+
+    if pipelined and overlap <= 0:
+        # chunks go to RunPod while ffmpeg is still segmenting
+        chunks, results, chunk_time = await pipelined_chunk_and_transcribe(
+            file_path, segment_time, segment_times, progress, normalize
+        )
+        transcription_start = chunk_start
+    else:
+        chunks = single_pass_segment_transcode(
+            file_path, segment_time=segment_time, segment_times=segment_times, overlap=overlap,
+            normalize=normalize
+        )
+        chunk_time = time.time() - chunk_start
+        for chunk in chunks:
+            progress.add_chunk(chunk)
+        progress.segmentation_done()
 
-    results = await asyncio.gather(*tasks)
+        # run all chunks concurrently on the shared RunPod client
+        transcription_start = time.time()
+        try:
+            results = await gather_or_cancel([
+                transcribe_tracked_chunk(progress, index) for index in range(len(chunks))
+            ])
+        except BaseException:
+            for chunk in chunks:
+                safe_remove(chunk["path"])
+            raise
     transcription_end = time.time()
     transcription_time = transcription_end - transcription_start
 
-    first_chunk_lang = results[0].get("detected_language")
-    merged_segments = []
-    for i, rdict in enumerate(results):
-        offset = i * segment_time
-        for seg in rdict.get("transcript", []):
-            seg["start"] += offset
-            seg["end"]   += offset
-        merged_segments.extend(rdict.get("transcript", []))
+    transcription_result = build_transcription_result(results, chunks, chunk_time, transcription_time)
+    if normalize:
+        transcription_result["normalization"] = normalization_report(source_bytes, chunks, chunk_time)
 
     # cleanup
-    for cp in chunk_files:
-        safe_remove(cp)
+    for chunk in chunks:
+        safe_remove(chunk["path"])
+    clear_checkpoints(job_id)
+
+    return transcription_result
 
+async def streamed_chunk_and_transcribe(body, segment_time: int = SEGMENT_TIME, on_progress=None,
+                                        job_id: str = None, normalize: bool = NORMALIZE_AUDIO) -> dict:
+    """
+    Like single_pass_chunk_and_transcribe, but the media comes from 'body'
+    (an async iterator of bytes, e.g. youtube_audio_stream) instead of a
+    file: chunks are cut and sent to RunPod while the source is still
+    arriving. Fixed-length chunks without overlap only.
+    """
+    progress = ChunkProgress(on_progress, job_id)
+    base_path = build_upload_path("")
+    transcription_start = time.time()
+    try:
+        chunks, results, chunk_time = await pipelined_chunk_and_transcribe(
+            base_path, segment_time, None, progress, normalize, body=body
+        )
+    except BaseException:
+        for path in glob.glob(f"{base_path}_chunk_*"):
+            safe_remove(path)
+        raise
+    # download, segmentation and transcription all ran together
+    transcription_result = build_transcription_result(
+        results, chunks, chunk_time, time.time() - transcription_start
+    )
+
+    for chunk in chunks:
+        safe_remove(chunk["path"])
+    clear_checkpoints(job_id)
+
+    return transcription_result
+
+async def transcribe_stored_chunks(chunks: list, chunk_time: float = 0.0, on_progress=None,
+                                   job_id: str = None) -> dict:
+    """
+    Transcribes chunks that are already on disk (e.g. from
+    ingest_stream_to_chunks) and merges the results the same way
+    single_pass_chunk_and_transcribe does. The chunks are removed afterwards.
+    """
+    progress = ChunkProgress(on_progress, job_id)
+    for chunk in chunks:
+        progress.add_chunk(chunk)
+    progress.segmentation_done()
+
+    transcription_start = time.time()
+    try:
+        results = await gather_or_cancel([
+            transcribe_tracked_chunk(progress, index) for index in range(len(chunks))
+        ])
+    finally:
+        for chunk in chunks:
+            safe_remove(chunk["path"])
+    clear_checkpoints(job_id)
+
+    return build_transcription_result(results, chunks, chunk_time, time.time() - transcription_start)
+
+def build_transcription_result(results: list, chunks: list, chunk_time: float, transcription_time: float) -> dict:
+    """
+    Merges the per-chunk RunPod results (in chunk order) into one transcription.
+    """
     return {
-        "transcript": merged_segments,
-        "detected_language": first_chunk_lang,
+        "transcript": merge_chunk_transcripts(results, chunks),
+        "detected_language": results[0].get("detected_language"),
         "is_runpod": True,
         "status_code": 200,
         "chunk_time": chunk_time,
-        "transcription_time": transcription_time
+        "transcription_time": transcription_time,
+        "runpod_queue_wait_time": max(r.get("queue_wait_time", 0.0) for r in results)
+    }
+
+async def transcribe_short_file(file_path: str) -> dict:
+    """
+    Transcribes 'file_path' with a single RunPod call, without segmenting it.
+    Meant for clips well under SEGMENT_TIME, where chunking would produce one
+    chunk anyway. Same result shape as single_pass_chunk_and_transcribe.
+    """
+    transcription_start = time.time()
+    result = await get_transcription(build_chunk_url(file_path))
+    return build_transcription_result([result], [{"start": 0.0}], 0.0, time.time() - transcription_start)
+
+def segment_media(file_path: str, segment_time: int = SEGMENT_TIME, chunking: str = CHUNKING_MODE,
+                  overlap: float = CHUNK_OVERLAP, normalize: bool = NORMALIZE_AUDIO) -> list:
+    """
+    Cuts 'file_path' into chunks the same way single_pass_chunk_and_transcribe
+    does, without transcribing them. Returns [{"path", "start", "end", "bytes"}, ...].
+    """
+    segment_times = plan_silence_cuts(file_path) if chunking == "silence" else None
+    return single_pass_segment_transcode(
+        file_path, segment_time=segment_time, segment_times=segment_times, overlap=overlap,
+        normalize=normalize
+    )
+
+def source_audio_bytes(file_path: str) -> int:
+    """
+    Approximate size of the first audio stream of 'file_path' (bit rate x
+    duration), or the whole file's size when ffprobe cannot tell.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "stream=bit_rate:format=duration",
+        "-of", "json",
+        file_path
+    ]
+    try:
+        probe = json.loads(subprocess.check_output(cmd))
+        bit_rate = float(probe["streams"][0]["bit_rate"])
+        duration = float(probe["format"]["duration"])
+        return int(bit_rate * duration / 8)
+    except Exception:
+        return file_size(file_path)
+
+def normalization_report(source_bytes: int, chunks: list, encode_time: float) -> dict:
+    """
+    What normalizing the chunks saved (bytes RunPod does not have to fetch)
+    and cost (the segmenting pass, which includes the re-encode).
+    """
+    chunk_bytes = sum(chunk.get("bytes", 0) for chunk in chunks)
+    observe(NORMALIZE_TIME_METRIC, encode_time)
+    return {
+        "codec": f"opus {NORMALIZE_BITRATE} {NORMALIZE_SAMPLE_RATE} Hz mono",
+        "source_audio_bytes": source_bytes,
+        "chunk_bytes": chunk_bytes,
+        "bytes_saved": source_bytes - chunk_bytes,
+        "encode_time": encode_time
     }
 
 def get_audio_duration(file_path: str) -> float:
@@ -286,64 +742,52 @@ def chunk_audio(file_path: str, chunk_size: int = 1200) -> list:
     print("chunk_audio => using file:", file_path)
     base, ext = os.path.splitext(file_path)
     chunk_pattern = f"{base}_chunk_%03d{ext}"
+    list_path = f"{base}_chunks.csv"
 
     cmd = [
         "ffmpeg",
         "-i", file_path,
         "-f", "segment",
         "-segment_time", str(chunk_size),
+        "-segment_list", list_path,
+        "-segment_list_type", "csv",
         "-c", "copy",
         chunk_pattern,
         "-y"
     ]
     try:
         subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
+        return parse_segment_list(list_path)
+    except (subprocess.CalledProcessError, OSError) as e:
         raise_http_exception_once(
             e,
             500,
             f"FFmpeg error while chunking: {str(e)}",
             f"The error: {str(e)}, in chunk_audio in helper.py"
         )
-
-    chunk_files = []
-    idx = 0
-    while True:
-        test_path = f"{base}_chunk_{idx:03d}{ext}"
-        if os.path.exists(test_path):
-            chunk_files.append(test_path)
-            idx += 1
-        else:
-            break
-
-    return chunk_files
+    finally:
+        safe_remove(list_path)
 
 async def chunk_and_transcribe(file_path: str, chunk_size: int = 1200) -> dict:
     chunk_start = time.time()
-    chunk_paths = chunk_audio(file_path, chunk_size=chunk_size)
+    chunks = chunk_audio(file_path, chunk_size=chunk_size)
     chunk_end = time.time()
     chunk_time = chunk_end - chunk_start
 
     transcription_start = time.time()
     tasks = []
-    for i, cp in enumerate(chunk_paths):
-        tasks.append(asyncio.to_thread(get_transcription, build_chunk_url(cp)))
-    results = await asyncio.gather(*tasks)
+    for chunk in chunks:
+        tasks.append(get_transcription(build_chunk_url(chunk["path"])))
+    results = await gather_or_cancel(tasks)
     transcription_end = time.time()
     transcription_time = transcription_end - transcription_start
 
     detected_lang = results[0].get("detected_language")
-    merged_segments = []
-    for i, rdict in enumerate(results):
-        offset = i * chunk_size
-        for seg in rdict.get("transcript", []):
-            seg["start"] += offset
-            seg["end"]   += offset
-        merged_segments.extend(rdict.get("transcript", []))
+    merged_segments = merge_chunk_transcripts(results, chunks)
 
     # cleanup
-    for cp in chunk_paths:
-        safe_remove(cp)
+    for chunk in chunks:
+        safe_remove(chunk["path"])
 
     return {
         "transcript": merged_segments,
@@ -351,7 +795,8 @@ async def chunk_and_transcribe(file_path: str, chunk_size: int = 1200) -> dict:
         "is_runpod": True,
         "status_code": 200,
         "chunk_time": chunk_time,
-        "transcription_time": transcription_time
+        "transcription_time": transcription_time,
+        "runpod_queue_wait_time": max(r.get("queue_wait_time", 0.0) for r in results)
     }
 
 def extension_for_codec(codec_name: str) -> str:
@@ -442,10 +887,13 @@ def ensure_audio_only(file_path: str) -> str:
     return out_file
 
 # **New** function to unify download + transcribe logic
-async def handle_audio_download_and_transcribe(local_path: str, url: str, chunk_size: int = 1200) -> dict:
+async def handle_audio_download_and_transcribe(local_path: str, url: str, chunk_size: int = 1200,
+                                              on_progress=None, job_id: str = None,
+                                              single_call: bool = False) -> dict:
     """
     Downloads an audio file from 'url', ensures it is single audio-only,
-    chunk & transcribe, then cleans up.
+    chunk & transcribe, then cleans up. With 'single_call' the file is not
+    chunked (see transcribe_short_file).
     """
     local_filename=local_path
     # local_filename = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.mp3")
@@ -456,13 +904,19 @@ async def handle_audio_download_and_transcribe(local_path: str, url: str, chunk_
     #     for chunk in response.iter_content(chunk_size=8192):
     #         f.write(chunk)
 
-    audio_only_file = ensure_audio_only(local_filename)
+    audio_only_file = await asyncio.to_thread(ensure_audio_only, local_filename)
     print("ensure_audio_only => returned:", audio_only_file)
-    transcription_result = await single_pass_chunk_and_transcribe(audio_only_file, chunk_size)
-
-    # Cleanup
-    safe_remove(audio_only_file)
-    if audio_only_file != local_filename:
-        safe_remove(local_filename)
+    try:
+        if single_call:
+            transcription_result = await transcribe_short_file(audio_only_file)
+        else:
+            transcription_result = await single_pass_chunk_and_transcribe(
+                audio_only_file, chunk_size, on_progress=on_progress, job_id=job_id
+            )
+    finally:
+        # Cleanup
+        safe_remove(audio_only_file)
+        if audio_only_file != local_filename:
+            safe_remove(local_filename)
 
     return transcription_result
@@ -0,0 +1,69 @@
+import math
+from services.redis_client import get_redis, get_async_redis
+from services.error_logging import log_error_once
+
+# Histograms are kept in Redis so every API and worker process feeds the
+# same series; GET /metrics renders them in Prometheus text format.
+HISTOGRAM_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 1800, 3600)
+METRIC_NAMES_KEY = "metrics:names"
+
+def _bucket_fields(value: float) -> list:
+    fields = [f"le:{b}" for b in HISTOGRAM_BUCKETS if value <= b]
+    fields.append("le:+Inf")
+    return fields
+
+def _queue_observation(pipe, name: str, value: float):
+    key = f"metrics:{name}"
+    pipe.sadd(METRIC_NAMES_KEY, name)
+    pipe.hincrby(key, "count", 1)
+    pipe.hincrbyfloat(key, "sum", value)
+    for field in _bucket_fields(value):
+        pipe.hincrby(key, field, 1)
+
+def observe(name: str, value: float):
+    """
+    Records one observation of histogram 'name'. No-op without Redis.
+    """
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        _queue_observation(pipe, name, value)
+        pipe.execute()
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in observe in metrics.py")
+
+async def observe_async(name: str, value: float):
+    r = get_async_redis()
+    if r is None:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        _queue_observation(pipe, name, value)
+        await pipe.execute()
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in observe_async in metrics.py")
+
+def render_prometheus() -> str:
+    """
+    All histograms in Prometheus text format; empty without Redis or when
+    Redis fails, so a scrape never errors.
+    """
+    r = get_redis()
+    if r is None:
+        return ""
+    try:
+        histograms = [(name, r.hgetall(f"metrics:{name}")) for name in sorted(r.smembers(METRIC_NAMES_KEY))]
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in render_prometheus in metrics.py")
+        return ""
+    lines = []
+    for name, data in histograms:
+        lines.append(f"# TYPE {name} histogram")
+        for bucket in list(HISTOGRAM_BUCKETS) + [math.inf]:
+            label = "+Inf" if bucket == math.inf else str(bucket)
+            lines.append(f'{name}_bucket{{le="{label}"}} {int(data.get(f"le:{label}", 0))}')
+        lines.append(f"{name}_sum {float(data.get('sum', 0))}")
+        lines.append(f"{name}_count {int(data.get('count', 0))}")
+    return "\n".join(lines) + "\n"
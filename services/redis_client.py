@@ -0,0 +1,47 @@
+import os
+import asyncio
+import weakref
+import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Shared Redis used for caches and coordination. Falls back to the Celery
+# result backend / broker, which are Redis in every deployment we run.
+REDIS_URL = (
+    os.getenv("REDIS_URL")
+    or os.getenv("CELERY_RESULT_BACKEND")
+    or os.getenv("CELERY_BROKER_URL")
+)
+
+_redis_client = None
+# redis.asyncio connections are bound to the loop that opened them.
+_async_clients = weakref.WeakKeyDictionary()
+
+def is_redis_url(url: str) -> bool:
+    return bool(url) and url.startswith(("redis://", "rediss://", "unix://"))
+
+def get_redis():
+    """
+    Returns a process-wide Redis client (connection pooled), or None when
+    no Redis URL is configured.
+    """
+    global _redis_client
+    if _redis_client is None and is_redis_url(REDIS_URL):
+        _redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis_client
+
+def get_async_redis():
+    """
+    Returns an asyncio Redis client for the running event loop, or None when
+    no Redis URL is configured.
+    """
+    if not is_redis_url(REDIS_URL):
+        return None
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
+        _async_clients[loop] = client
+    return client
@@ -0,0 +1,41 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Jobs are routed by media duration so a 30 s clip never waits behind
+# 2-hour videos. Each queue gets its own worker pool, e.g.
+#   celery -A celeryapp worker -Q transcribe_short -c 8
+#   celery -A celeryapp worker -Q transcribe_medium -c 4
+#   celery -A celeryapp worker -Q transcribe_long -c 2
+SHORT_QUEUE = os.getenv("SHORT_QUEUE", "transcribe_short")
+MEDIUM_QUEUE = os.getenv("MEDIUM_QUEUE", "transcribe_medium")
+LONG_QUEUE = os.getenv("LONG_QUEUE", "transcribe_long")
+SHORT_JOB_MAX_SECONDS = float(os.getenv("SHORT_JOB_MAX_SECONDS", "600"))  # 10 minutes
+MEDIUM_JOB_MAX_SECONDS = float(os.getenv("MEDIUM_JOB_MAX_SECONDS", "3600"))  # 1 hour
+# Longest media we expect at all; only used to spread priorities in the long queue.
+LONG_JOB_MAX_SECONDS = float(os.getenv("LONG_JOB_MAX_SECONDS", "7200"))
+
+# Redis broker priorities: 0 is served first, 9 last.
+HIGHEST_PRIORITY = 0
+LOWEST_PRIORITY = 9
+DEFAULT_PRIORITY = (HIGHEST_PRIORITY + LOWEST_PRIORITY) // 2
+
+def queue_bounds(duration: float) -> tuple:
+    if duration <= SHORT_JOB_MAX_SECONDS:
+        return SHORT_QUEUE, 0.0, SHORT_JOB_MAX_SECONDS
+    if duration <= MEDIUM_JOB_MAX_SECONDS:
+        return MEDIUM_QUEUE, SHORT_JOB_MAX_SECONDS, MEDIUM_JOB_MAX_SECONDS
+    return LONG_QUEUE, MEDIUM_JOB_MAX_SECONDS, max(LONG_JOB_MAX_SECONDS, MEDIUM_JOB_MAX_SECONDS + 1)
+
+def routing_for_duration(duration: float = None) -> dict:
+    """
+    apply_async options (queue, priority) for a job whose media lasts
+    'duration' seconds. Inside a queue, shorter jobs get a better priority
+    (shortest job first). Unknown durations go to the medium queue.
+    """
+    if not duration or duration <= 0:
+        return {"queue": MEDIUM_QUEUE, "priority": DEFAULT_PRIORITY}
+    queue, low, high = queue_bounds(duration)
+    position = min(1.0, max(0.0, (duration - low) / (high - low)))
+    return {"queue": queue, "priority": HIGHEST_PRIORITY + round(position * (LOWEST_PRIORITY - HIGHEST_PRIORITY))}
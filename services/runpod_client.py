@@ -0,0 +1,245 @@
+import os
+import time
+import random
+import asyncio
+import weakref
+import httpx
+from dotenv import load_dotenv
+
+from services.error_logging import raise_http_exception_once
+from services.runpod_governor import runpod_slot
+from services.runpod_webhook import (
+    RUNPOD_WEBHOOK_POLL_INTERVAL,
+    build_webhook_url,
+    wait_for_webhook,
+    webhooks_enabled
+)
+
+load_dotenv()
+
+RUNPOD_MAX_CONNECTIONS = int(os.getenv("RUNPOD_MAX_CONNECTIONS", "8"))
+RUNPOD_MAX_INFLIGHT = int(os.getenv("RUNPOD_MAX_INFLIGHT", "64"))  # jobs tracked at once per process
+RUNPOD_JOB_TIMEOUT = float(os.getenv("RUNPOD_JOB_TIMEOUT", "3600"))  # overall deadline per job, seconds
+RUNPOD_POLL_MIN_INTERVAL = float(os.getenv("RUNPOD_POLL_MIN_INTERVAL", "0.5"))
+RUNPOD_POLL_MAX_INTERVAL = float(os.getenv("RUNPOD_POLL_MAX_INTERVAL", "15"))
+RUNPOD_POLL_MAX_ERRORS = int(os.getenv("RUNPOD_POLL_MAX_ERRORS", "5"))  # consecutive transient errors
+
+FINAL_FAILURE_STATUSES = ("FAILED", "CANCELLED", "TIMED_OUT")
+
+# One pooled client and in-flight limiter per event loop. Celery workers keep
+# a single long-lived loop (see run_async in tasks.py), so in practice this is
+# one keep-alive pool per worker process.
+_loop_state = weakref.WeakKeyDictionary()
+
+def _get_loop_state() -> dict:
+    loop = asyncio.get_running_loop()
+    state = _loop_state.get(loop)
+    if state is None:
+        state = {
+            "client": httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=RUNPOD_MAX_CONNECTIONS,
+                    max_keepalive_connections=RUNPOD_MAX_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(30.0)
+            ),
+            "semaphore": asyncio.Semaphore(RUNPOD_MAX_INFLIGHT)
+        }
+        _loop_state[loop] = state
+    return state
+
+async def close_runpod_client():
+    """
+    Closes the pooled client bound to the running event loop, if any.
+    """
+    loop = asyncio.get_running_loop()
+    state = _loop_state.pop(loop, None)
+    if state is not None:
+        await state["client"].aclose()
+
+def _runpod_config() -> tuple:
+    endpoint_url = os.getenv('RUNPOD_SERVERLESS_URL')
+    runpod_api_key = os.getenv('RUNPOD_AUTH_TOKEN')
+    if not endpoint_url or not runpod_api_key:
+        raise_http_exception_once(
+            Exception("Missing env keys"),
+            500,
+            "Endpoint URL or RunPod API key not found in environment variables.",
+            "The error: Endpoint URL or RunPod API key not found in environment variables, in get_transcription in runpod_client.py"
+        )
+    headers = {
+        'authorization': runpod_api_key,
+        'content-type': 'application/json',
+    }
+    return endpoint_url, headers
+
+def next_poll_interval(previous: float) -> float:
+    """
+    Decorrelated jitter backoff between RUNPOD_POLL_MIN_INTERVAL and
+    RUNPOD_POLL_MAX_INTERVAL, so many jobs polled together spread out.
+    """
+    upper = max(RUNPOD_POLL_MIN_INTERVAL, previous * 3)
+    return min(RUNPOD_POLL_MAX_INTERVAL, random.uniform(RUNPOD_POLL_MIN_INTERVAL, upper))
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+async def submit_job(client: httpx.AsyncClient, endpoint_url: str, headers: dict, payload: dict) -> str:
+    try:
+        response = await client.post(f"{endpoint_url}/run", headers=headers, json=payload)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        raise_http_exception_once(
+            e,
+            500,
+            f"Failed to initiate transcription job: {e}",
+            f"The error: {str(e)}, in submit_job in runpod_client.py"
+        )
+
+    try:
+        data = response.json()
+    except ValueError as e:
+        raise_http_exception_once(
+            e,
+            500,
+            f"Failed to parse initiation response as JSON: {e}",
+            f"The error: {str(e)}, in submit_job in runpod_client.py"
+        )
+
+    if "id" not in data:
+        raise_http_exception_once(
+            Exception("No 'id' in response"),
+            500,
+            "Response JSON does not contain 'id' field - cannot track job.",
+            "The error: Response JSON does not contain 'id' field - cannot track job, in submit_job in runpod_client.py"
+        )
+    return data["id"]
+
+async def fetch_job_status(client: httpx.AsyncClient, endpoint_url: str, headers: dict, job_id: str) -> dict:
+    response = await client.get(f"{endpoint_url}/status/{job_id}", headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+async def cancel_job(client: httpx.AsyncClient, endpoint_url: str, headers: dict, job_id: str):
+    try:
+        await client.post(f"{endpoint_url}/cancel/{job_id}", headers=headers)
+    except httpx.HTTPError as e:
+        print(f"[RunPod] Failed to cancel job {job_id}: {e}")
+
+async def wait_for_job(client: httpx.AsyncClient, endpoint_url: str, headers: dict, job_id: str, deadline: float) -> dict:
+    """
+    Waits for the job until it completes, fails, or 'deadline' (a
+    time.monotonic() value) passes. With webhooks enabled the completion
+    callback wakes us up and status polling only runs every
+    RUNPOD_WEBHOOK_POLL_INTERVAL; otherwise the job is polled with jittered,
+    growing intervals.
+    """
+    use_webhook = webhooks_enabled()
+    interval = RUNPOD_POLL_MIN_INTERVAL
+    last_status = None
+    errors = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            await cancel_job(client, endpoint_url, headers, job_id)
+            raise_http_exception_once(
+                Exception("RunPod job timed out"),
+                504,
+                f"Transcription job {job_id} did not finish within {RUNPOD_JOB_TIMEOUT:.0f} seconds.",
+                f"The error: RunPod job {job_id} exceeded {RUNPOD_JOB_TIMEOUT:.0f}s, in wait_for_job in runpod_client.py"
+            )
+        result = None
+        if use_webhook:
+            safety_interval = RUNPOD_WEBHOOK_POLL_INTERVAL * random.uniform(0.8, 1.2)
+            result = await wait_for_webhook(job_id, min(safety_interval, remaining))
+        else:
+            await asyncio.sleep(min(interval, remaining))
+
+        if result is None:
+            try:
+                result = await fetch_job_status(client, endpoint_url, headers, job_id)
+                errors = 0
+            except (httpx.HTTPError, ValueError) as e:
+                errors += 1
+                if not _is_transient(e) or errors > RUNPOD_POLL_MAX_ERRORS:
+                    raise_http_exception_once(
+                        e,
+                        500,
+                        f"Error while polling job status: {e}",
+                        f"The error: {str(e)}, in wait_for_job in runpod_client.py"
+                    )
+                interval = next_poll_interval(interval)
+                continue
+
+        status = result.get("status")
+        if status in FINAL_FAILURE_STATUSES:
+            raise_http_exception_once(
+                Exception(f"Job {status.lower()} on server"),
+                500,
+                "Transcription job failed on the server side.",
+                f"The error: Transcription job {job_id} ended with status {status}, in wait_for_job in runpod_client.py"
+            )
+        if status == "COMPLETED":
+            return result
+
+        # Start over from short intervals whenever the job moves on
+        # (IN_QUEUE -> IN_PROGRESS), otherwise back off.
+        interval = RUNPOD_POLL_MIN_INTERVAL if status != last_status else next_poll_interval(interval)
+        last_status = status
+
+def parse_transcription_output(result: dict) -> dict:
+    output = result.get("output")
+    if not isinstance(output, dict) or "segments" not in output:
+        raise_http_exception_once(
+            Exception("Missing 'segments' in response"),
+            500,
+            "Transcription result does not contain expected 'segments' field.",
+            "The error: Transcription result does not contain expected 'segments' field, in parse_transcription_output in runpod_client.py"
+        )
+
+    transcript_data = [
+        {"text": seg["text"], "start": seg["start"], "end": seg["end"]}
+        for seg in output["segments"]
+    ]
+    return {
+        "transcript": transcript_data,
+        "detected_language": output.get("detected_language", None),
+        "is_runpod": True,
+        "status_code": 200
+    }
+
+async def get_transcription(audio_url: str) -> dict:
+    """
+    Submits 'audio_url' to the RunPod serverless endpoint (registering the
+    completion webhook when configured) and waits for the transcript. Uses
+    the loop's pooled keep-alive client; at most RUNPOD_MAX_INFLIGHT jobs
+    are tracked at once per process and each job is bounded by
+    RUNPOD_JOB_TIMEOUT.
+    """
+    endpoint_url, headers = _runpod_config()
+    state = _get_loop_state()
+    client = state["client"]
+
+    wait_start = time.monotonic()
+    async with state["semaphore"]:
+        # includes the wait for this process's in-flight limit
+        async with runpod_slot(endpoint_url, wait_start) as queue_wait:
+            deadline = time.monotonic() + RUNPOD_JOB_TIMEOUT
+            payload = {"input": {"audio": audio_url}}
+            if webhooks_enabled():
+                payload["webhook"] = build_webhook_url()
+            job_id = await submit_job(client, endpoint_url, headers, payload)
+            try:
+                result = await wait_for_job(client, endpoint_url, headers, job_id, deadline)
+            except asyncio.CancelledError:
+                # the caller gave up (e.g. a sibling chunk failed); free the GPU
+                await asyncio.shield(cancel_job(client, endpoint_url, headers, job_id))
+                raise
+
+    transcription = parse_transcription_output(result)
+    transcription["queue_wait_time"] = queue_wait
+    return transcription
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+from services.redis_client import get_async_redis
+from services.metrics import observe_async
+from services.error_logging import log_error_once, raise_http_exception_once
+
+load_dotenv()
+
+# Cluster-wide cap on RunPod jobs in flight across all workers (0 = no cap).
+RUNPOD_GLOBAL_CONCURRENCY = int(os.getenv("RUNPOD_GLOBAL_CONCURRENCY", "0"))
+# Per-endpoint caps, e.g. {"https://api.runpod.ai/v2/abc123": 10}; endpoints not
+# listed use RUNPOD_DEFAULT_ENDPOINT_CONCURRENCY (0 = no cap).
+RUNPOD_ENDPOINT_CONCURRENCY = json.loads(os.getenv("RUNPOD_ENDPOINT_CONCURRENCY", "{}"))
+RUNPOD_DEFAULT_ENDPOINT_CONCURRENCY = int(os.getenv("RUNPOD_DEFAULT_ENDPOINT_CONCURRENCY", "0"))
+# A slot whose holder died is reclaimed after this many seconds.
+RUNPOD_SLOT_LEASE = float(os.getenv("RUNPOD_SLOT_LEASE", str(float(os.getenv("RUNPOD_JOB_TIMEOUT", "3600")) + 120)))
+RUNPOD_SLOT_RETRY_MAX = 2.0  # seconds between acquire attempts, upper bound
+# A chunk gives up (503) after waiting this long for a slot. Part of the
+# broker visibility timeout, see celeryapp.py.
+RUNPOD_SLOT_WAIT_TIMEOUT = float(os.getenv("RUNPOD_SLOT_WAIT_TIMEOUT", "1800"))
+
+QUEUE_WAIT_METRIC = "runpod_queue_wait_seconds"
+GLOBAL_SLOTS_KEY = "runpod:slots:global"
+
+# Holders are sorted-set members scored by lease expiry. Expired holders are
+# dropped, then all semaphores are checked and taken together or not at all.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+    local limit = tonumber(ARGV[3 + i])
+    if limit > 0 and redis.call('ZCARD', key) >= limit then
+        return 0
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, ARGV[2], ARGV[3])
+end
+return 1
+"""
+
+def endpoint_slots_key(endpoint_url: str) -> str:
+    return f"runpod:slots:endpoint:{endpoint_url}"
+
+def endpoint_limit(endpoint_url: str) -> int:
+    return int(RUNPOD_ENDPOINT_CONCURRENCY.get(endpoint_url, RUNPOD_DEFAULT_ENDPOINT_CONCURRENCY))
+
+def _semaphores(endpoint_url: str) -> list:
+    # The global set is always written, capped or not (limit 0), so jobs in
+    # flight can be counted for admission control.
+    semaphores = [(GLOBAL_SLOTS_KEY, RUNPOD_GLOBAL_CONCURRENCY)]
+    if endpoint_limit(endpoint_url) > 0:
+        semaphores.append((endpoint_slots_key(endpoint_url), endpoint_limit(endpoint_url)))
+    return semaphores
+
+async def count_runpod_slots_in_use(endpoint_url: str = None) -> int:
+    """
+    Number of RunPod jobs currently holding a slot, cluster-wide or for one endpoint.
+    """
+    r = get_async_redis()
+    if r is None:
+        return 0
+    key = endpoint_slots_key(endpoint_url) if endpoint_url else GLOBAL_SLOTS_KEY
+    await r.zremrangebyscore(key, "-inf", time.time())
+    return await r.zcard(key)
+
+@asynccontextmanager
+async def runpod_slot(endpoint_url: str, wait_start: float = None):
+    """
+    Holds one cluster-wide RunPod slot (global and per-endpoint) while the
+    body runs; without caps the slot is only recorded, never waited for. Yields the seconds spent waiting since 'wait_start' (a
+    time.monotonic() value, default now), which is also recorded as the
+    runpod_queue_wait_seconds histogram, with or without caps configured.
+    """
+    wait_start = time.monotonic() if wait_start is None else wait_start
+    semaphores = _semaphores(endpoint_url)
+    r = get_async_redis()
+    if r is None:
+        queue_wait = time.monotonic() - wait_start
+        await observe_async(QUEUE_WAIT_METRIC, queue_wait)
+        yield queue_wait
+        return
+
+    keys = [key for key, _ in semaphores]
+    limits = [limit for _, limit in semaphores]
+    holder = uuid.uuid4().hex
+    acquire = r.register_script(ACQUIRE_SCRIPT)
+    delay = 0.1
+    acquired = False
+    try:
+        while not acquired:
+            now = time.time()
+            try:
+                acquired = bool(await acquire(keys=keys, args=[now, now + RUNPOD_SLOT_LEASE, holder, *limits]))
+            except Exception as e:
+                # Never let the governor take transcription down with it.
+                log_error_once(e, f"The error: {str(e)}, in runpod_slot in runpod_governor.py")
+                break
+            if not acquired:
+                if time.monotonic() - wait_start >= RUNPOD_SLOT_WAIT_TIMEOUT:
+                    raise_http_exception_once(
+                        Exception("RunPod slot wait timed out"),
+                        503,
+                        f"No RunPod capacity within {RUNPOD_SLOT_WAIT_TIMEOUT:.0f} seconds.",
+                        f"The error: waited {RUNPOD_SLOT_WAIT_TIMEOUT:.0f}s for a RunPod slot, in runpod_slot in runpod_governor.py"
+                    )
+                await asyncio.sleep(random.uniform(0, delay))
+                delay = min(RUNPOD_SLOT_RETRY_MAX, delay * 2)
+
+        queue_wait = time.monotonic() - wait_start
+        await observe_async(QUEUE_WAIT_METRIC, queue_wait)
+        yield queue_wait
+    finally:
+        if acquired:
+            try:
+                pipe = r.pipeline(transaction=False)
+                for key in keys:
+                    pipe.zrem(key, holder)
+                await pipe.execute()
+            except Exception as e:
+                log_error_once(e, f"The error: {str(e)}, in runpod_slot in runpod_governor.py")
@@ -0,0 +1,134 @@
+import os
+import hmac
+import json
+import asyncio
+import weakref
+from urllib.parse import urlencode
+from dotenv import load_dotenv
+
+from services.redis_client import REDIS_URL, get_async_redis, is_redis_url
+from services.error_logging import log_error_once, raise_http_exception_once
+
+load_dotenv()
+
+# Public URL of the POST /runpod/webhook route, e.g. https://api.example.com/runpod/webhook
+RUNPOD_WEBHOOK_URL = os.getenv("RUNPOD_WEBHOOK_URL")
+RUNPOD_WEBHOOK_SECRET = os.getenv("RUNPOD_WEBHOOK_SECRET")
+# With webhooks on, status polling is only a safety net for lost callbacks.
+RUNPOD_WEBHOOK_POLL_INTERVAL = float(os.getenv("RUNPOD_WEBHOOK_POLL_INTERVAL", "60"))
+RUNPOD_WEBHOOK_RESULT_TTL = int(os.getenv("RUNPOD_WEBHOOK_RESULT_TTL", "3600"))
+
+COMPLETIONS_CHANNEL = "runpod:completions"
+
+# Per event loop: one pub/sub subscription shared by every waiting job.
+_listeners = weakref.WeakKeyDictionary()
+
+def result_key(job_id: str) -> str:
+    return f"runpod:result:{job_id}"
+
+def webhooks_enabled() -> bool:
+    return bool(RUNPOD_WEBHOOK_URL and RUNPOD_WEBHOOK_SECRET) and is_redis_url(REDIS_URL)
+
+def build_webhook_url() -> str:
+    """
+    RunPod cannot send custom headers, so the shared secret travels as a
+    query parameter on the callback URL.
+    """
+    return f"{RUNPOD_WEBHOOK_URL}?{urlencode({'token': RUNPOD_WEBHOOK_SECRET})}"
+
+def check_webhook_token(token: str) -> bool:
+    if not RUNPOD_WEBHOOK_SECRET or not token:
+        return False
+    return hmac.compare_digest(token, RUNPOD_WEBHOOK_SECRET)
+
+async def publish_job_result(job_result: dict):
+    """
+    Stores a job result received from RunPod and wakes whichever worker is
+    waiting for it. Answers 503 when Redis is not configured or not
+    reachable, so RunPod retries the callback.
+    """
+    r = get_async_redis()
+    if r is None:
+        raise_http_exception_once(
+            Exception("Redis not configured"),
+            503,
+            "Webhook results cannot be stored: Redis is not configured.",
+            "The error: Redis is not configured, in publish_job_result in runpod_webhook.py"
+        )
+    job_id = job_result["id"]
+    try:
+        await r.set(result_key(job_id), json.dumps(job_result), ex=RUNPOD_WEBHOOK_RESULT_TTL)
+        await r.publish(COMPLETIONS_CHANNEL, job_id)
+    except Exception as e:
+        raise_http_exception_once(
+            e,
+            503,
+            "Webhook results cannot be stored right now.",
+            f"The error: {str(e)}, in publish_job_result in runpod_webhook.py"
+        )
+
+async def _pop_job_result(job_id: str):
+    r = get_async_redis()
+    raw = await r.getdel(result_key(job_id))
+    return json.loads(raw) if raw else None
+
+async def _listen(state: dict):
+    while True:
+        pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(COMPLETIONS_CHANNEL)
+            state["ready"].set()
+            async for message in pubsub.listen():
+                for future in state["waiters"].pop(message["data"], []):
+                    if not future.done():
+                        future.set_result(True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log_error_once(e, f"The error: {str(e)}, in _listen in runpod_webhook.py")
+            state["ready"].clear()
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.close()
+
+async def _get_listener() -> dict:
+    loop = asyncio.get_running_loop()
+    state = _listeners.get(loop)
+    if state is None or state["task"].done():
+        state = {"waiters": {}, "ready": asyncio.Event()}
+        state["task"] = loop.create_task(_listen(state))
+        _listeners[loop] = state
+    await state["ready"].wait()
+    return state
+
+async def wait_for_webhook(job_id: str, timeout: float):
+    """
+    Waits up to 'timeout' seconds for RunPod's webhook for 'job_id'.
+    Returns the job result, or None when nothing arrived in time or Redis
+    failed, so the caller falls back to polling the status.
+    """
+    try:
+        state = await asyncio.wait_for(_get_listener(), timeout)
+    except asyncio.TimeoutError:
+        return None
+
+    future = asyncio.get_running_loop().create_future()
+    state["waiters"].setdefault(job_id, []).append(future)
+    try:
+        # The callback may have landed before we subscribed.
+        job_result = await _pop_job_result(job_id)
+        if job_result is not None:
+            return job_result
+        await asyncio.wait_for(future, timeout)
+        return await _pop_job_result(job_id)
+    except asyncio.TimeoutError:
+        return None
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in wait_for_webhook in runpod_webhook.py")
+        return None
+    finally:
+        waiters = state["waiters"].get(job_id, [])
+        if future in waiters:
+            waiters.remove(future)
+        if not waiters:
+            state["waiters"].pop(job_id, None)
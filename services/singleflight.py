@@ -0,0 +1,98 @@
+import os
+import hashlib
+from dotenv import load_dotenv
+
+from services.redis_client import get_redis
+from services.error_logging import log_error_once
+
+load_dotenv()
+
+# An in-flight claim outlives any job; it is released when the job finishes.
+INFLIGHT_TTL = int(os.getenv("INFLIGHT_TTL", str(6 * 3600)))
+# How long an Idempotency-Key keeps returning the task it first created.
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+
+# Returns the task already holding the claim, or takes it for ARGV[1].
+CLAIM_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    return current
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('SET', KEYS[2], KEYS[1], 'EX', ARGV[2])
+return false
+"""
+
+# Drops the claim only if it still belongs to the finishing task.
+RELEASE_SCRIPT = """
+local key = redis.call('GET', KEYS[1])
+redis.call('DEL', KEYS[1])
+if key and redis.call('GET', key) == ARGV[1] then
+    redis.call('DEL', key)
+end
+return 1
+"""
+
+def inflight_key(kind: str, identity: str) -> str:
+    return f"inflight:{kind}:{identity}"
+
+def _task_claim_key(task_id: str) -> str:
+    return f"inflight:task:{task_id}"
+
+def idempotency_request_key(endpoint: str, key: str, tenant_name: str) -> str:
+    # scoped per customer: another API key sending the same value gets its own job
+    return f"idempotency:{tenant_name}:{endpoint}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+def claim_inflight(key: str, task_id: str):
+    """
+    Registers 'task_id' as the job working on 'key'. Returns None when the
+    claim was taken, or the id of the task already in flight for 'key'.
+    Without Redis every submission runs on its own.
+    """
+    r = get_redis()
+    if r is None or not key:
+        return None
+    try:
+        return r.eval(CLAIM_SCRIPT, 2, key, _task_claim_key(task_id), task_id, INFLIGHT_TTL)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in claim_inflight in singleflight.py")
+        return None
+
+def release_inflight(task_id: str):
+    """
+    Called when 'task_id' reaches a final state, so the next submission for
+    the same media starts a new job (and usually hits the transcript cache).
+    """
+    r = get_redis()
+    if r is None or not task_id:
+        return
+    try:
+        r.eval(RELEASE_SCRIPT, 1, _task_claim_key(task_id), task_id)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in release_inflight in singleflight.py")
+
+def get_idempotent_task(key: str):
+    r = get_redis()
+    if r is None or not key:
+        return None
+    try:
+        return r.get(key)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in get_idempotent_task in singleflight.py")
+        return None
+
+def remember_idempotent_task(key: str, task_id: str) -> str:
+    """
+    Maps 'key' to 'task_id' unless another request got there first.
+    Returns the task id the key now points to.
+    """
+    r = get_redis()
+    if r is None or not key:
+        return task_id
+    try:
+        if r.set(key, task_id, nx=True, ex=IDEMPOTENCY_TTL):
+            return task_id
+        return r.get(key) or task_id
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in remember_idempotent_task in singleflight.py")
+        return task_id
@@ -0,0 +1,155 @@
+import os
+import re
+import difflib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Two segments from neighbouring chunks are the same speech when they start
+# within this many seconds of each other and their texts are this similar.
+OVERLAP_TIME_TOLERANCE = float(os.getenv("OVERLAP_TIME_TOLERANCE", "1.5"))
+OVERLAP_TEXT_SIMILARITY = float(os.getenv("OVERLAP_TEXT_SIMILARITY", "0.6"))
+# Shortest run of words both chunks must share for the overlap to be joined
+# on the text itself.
+OVERLAP_MIN_WORDS = int(os.getenv("OVERLAP_MIN_WORDS", "2"))
+
+def _normalise(text: str) -> str:
+    return re.sub(r"[^\w\s]", "", text.lower()).strip()
+
+def text_similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, _normalise(a), _normalise(b)).ratio()
+
+def _midpoint(seg: dict) -> float:
+    return (seg["start"] + seg["end"]) / 2
+
+def _words(segments: list) -> list:
+    """
+    (segment index, word index, normalised word) for every word of 'segments'.
+    """
+    words = []
+    for i, seg in enumerate(segments):
+        for j, word in enumerate(seg["text"].split()):
+            words.append((i, j, _normalise(word)))
+    return words
+
+def _word_time(seg: dict, index: int) -> float:
+    # Segments carry no word timings; words are assumed evenly spread.
+    count = max(1, len(seg["text"].split()))
+    return seg["start"] + (seg["end"] - seg["start"]) * index / count
+
+def _trim(seg: dict, start_word: int, end_word: int = None) -> dict:
+    """
+    'seg' cut down to its words [start_word, end_word), with estimated times.
+    """
+    words = seg["text"].split()
+    end_word = len(words) if end_word is None else end_word
+    lead = seg["text"][:len(seg["text"]) - len(seg["text"].lstrip())]
+    return dict(
+        seg,
+        text=lead + " ".join(words[start_word:end_word]),
+        start=_word_time(seg, start_word),
+        end=_word_time(seg, end_word)
+    )
+
+def _join_on_shared_words(prev_overlap: list, next_overlap: list, region_start: float, region_end: float):
+    """
+    Joins the overlapping segments on the longest run of words both chunks
+    transcribed, or returns None when they share fewer than OVERLAP_MIN_WORDS.
+    The run is kept from the chunk where it lies farther from the cut; the
+    other chunk's copy and the words beyond it (clipped at that chunk's edge)
+    are dropped.
+    """
+    prev_words = _words(prev_overlap)
+    next_words = _words(next_overlap)
+    matcher = difflib.SequenceMatcher(
+        None, [w for _, _, w in prev_words], [w for _, _, w in next_words], autojunk=False
+    )
+    match = matcher.find_longest_match(0, len(prev_words), 0, len(next_words))
+    if match.size < max(1, OVERLAP_MIN_WORDS):
+        return None
+
+    first_prev = prev_words[match.a]
+    last_prev = prev_words[match.a + match.size - 1]
+    first_next = next_words[match.b]
+    last_next = next_words[match.b + match.size - 1]
+    prev_margin = region_end - _word_time(prev_overlap[last_prev[0]], last_prev[1] + 1)
+    next_margin = _word_time(next_overlap[first_next[0]], first_next[1]) - region_start
+
+    if prev_margin >= next_margin:
+        # previous chunk keeps the run; the next chunk resumes after it
+        cut_prev, cut_next = last_prev, last_next
+        prev_end_word = cut_prev[1] + 1
+        next_start_word = cut_next[1] + 1
+    else:
+        # next chunk keeps the run; the previous chunk stops before it
+        cut_prev, cut_next = first_prev, first_next
+        prev_end_word = cut_prev[1]
+        next_start_word = cut_next[1]
+
+    joined = prev_overlap[:cut_prev[0]]
+    if prev_end_word > 0:
+        joined.append(_trim(prev_overlap[cut_prev[0]], 0, prev_end_word))
+    if next_start_word < len(next_overlap[cut_next[0]]["text"].split()):
+        joined.append(_trim(next_overlap[cut_next[0]], next_start_word))
+    joined.extend(next_overlap[cut_next[0] + 1:])
+    return joined
+
+def reconcile_overlap(prev_segments: list, next_segments: list, region_start: float, region_end: float) -> list:
+    """
+    Joins the (already offset) segments of two neighbouring chunks that both
+    cover [region_start, region_end].
+
+    Segments outside the region are kept as they are. Segments reaching into
+    it are joined on the longest run of words both chunks share (see
+    _join_on_shared_words), since the two chunks rarely cut the speech into
+    segments at the same places. Without such a run, a segment of the next
+    chunk that matches one of the previous chunk (start times within
+    OVERLAP_TIME_TOLERANCE and text similarity >= OVERLAP_TEXT_SIMILARITY) is
+    the same speech transcribed twice: we keep the copy that lies farther
+    from its own chunk's cut, since that one was not clipped. Unmatched
+    segments are kept on the side of the region's midpoint they belong to.
+    """
+    if region_end <= region_start:
+        return prev_segments + next_segments
+
+    split = (region_start + region_end) / 2
+    prev_kept = [s for s in prev_segments if s["end"] <= region_start]
+    prev_overlap = [s for s in prev_segments if s["end"] > region_start]
+    next_kept = [s for s in next_segments if s["start"] >= region_end]
+    next_overlap = [s for s in next_segments if s["start"] < region_end]
+
+    joined = _join_on_shared_words(prev_overlap, next_overlap, region_start, region_end)
+    if joined is not None:
+        return prev_kept + joined + next_kept
+
+    reconciled = []
+    matched_prev = set()
+    for nseg in next_overlap:
+        match = None
+        for i, pseg in enumerate(prev_overlap):
+            if i in matched_prev:
+                continue
+            if abs(pseg["start"] - nseg["start"]) > OVERLAP_TIME_TOLERANCE:
+                continue
+            if text_similarity(pseg["text"], nseg["text"]) >= OVERLAP_TEXT_SIMILARITY:
+                match = i
+                break
+        if match is None:
+            if _midpoint(nseg) >= split:
+                reconciled.append(nseg)
+            continue
+        matched_prev.add(match)
+        pseg = prev_overlap[match]
+        prev_margin = region_end - pseg["end"]
+        next_margin = nseg["start"] - region_start
+        if prev_margin == next_margin:
+            reconciled.append(pseg if len(pseg["text"]) >= len(nseg["text"]) else nseg)
+        else:
+            reconciled.append(pseg if prev_margin > next_margin else nseg)
+
+    for i, pseg in enumerate(prev_overlap):
+        if i not in matched_prev and _midpoint(pseg) < split:
+            reconciled.append(pseg)
+
+    reconciled.sort(key=lambda s: s["start"])
+    return prev_kept + reconciled + next_kept
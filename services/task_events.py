@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import asyncio
+
+from services.redis_client import get_redis, get_async_redis
+from services.error_logging import log_error_once
+
+PROGRESS_STATE = "PROGRESS"
+FINAL_STATES = ("SUCCESS", "FAILURE", "REVOKED")
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+TASK_STATUS_MAX_WAIT = float(os.getenv("TASK_STATUS_MAX_WAIT", "30"))
+
+def task_channel(task_id: str) -> str:
+    return f"task_events:{task_id}"
+
+def publish_task_event(task_id: str, event: str, data):
+    """
+    Publishes one event for 'task_id' on Redis pub/sub; /task_stream
+    subscribers receive it. No-op without Redis.
+    """
+    r = get_redis()
+    if r is None or not task_id:
+        return
+    try:
+        r.publish(task_channel(task_id), json.dumps({"event": event, "data": data}))
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in publish_task_event in task_events.py")
+
+def make_progress_reporter(task, task_id: str = None):
+    """
+    Returns an on_progress callback that stores per-chunk progress and the
+    transcript merged so far as the Celery task's PROGRESS meta, which
+    /task_status/{task_id} returns while the task runs, and pushes the new
+    chunk's segments to /task_stream/{task_id} listeners. 'task_id' defaults
+    to the running task; chunk tasks pass the id of the job they belong to.
+    """
+    task_id = task_id or task.request.id
+
+    def report(progress: dict, partial_transcript: list, chunk_segments: list):
+        task.update_state(
+            task_id=task_id,
+            state=PROGRESS_STATE,
+            meta={"progress": progress, "partial_transcript": partial_transcript}
+        )
+        publish_task_event(task_id, "progress", {"progress": progress, "segments": chunk_segments})
+    return report
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def task_event_stream(task_id: str, get_snapshot):
+    """
+    Server-Sent Events for one task. Subscribes first, then sends the
+    current state from 'get_snapshot(task_id)' (a blocking callable returning
+    (state, payload)), so no event in between is lost. Ends after the
+    final result.
+    """
+    pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(task_channel(task_id))
+    try:
+        state, payload = await asyncio.to_thread(get_snapshot, task_id)
+        if state in FINAL_STATES:
+            yield format_sse("result", payload)
+            return
+        yield format_sse("snapshot", {"status": state, **payload})
+
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SSE_HEARTBEAT_SECONDS)
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+            event = json.loads(message["data"])
+            yield format_sse(event["event"], event["data"])
+            if event["event"] == "result":
+                return
+    finally:
+        await pubsub.unsubscribe(task_channel(task_id))
+        await pubsub.close()
+
+async def snapshot_after_change(task_id: str, get_snapshot, wait: float) -> tuple:
+    """
+    Long-poll helper: returns get_snapshot(task_id) as soon as the task has
+    published an event (state change, progress or result) or 'wait' seconds
+    pass. Returns immediately when the task is already finished.
+    """
+    wait = min(max(wait, 0.0), TASK_STATUS_MAX_WAIT)
+    r = get_async_redis()
+    if r is None or wait <= 0:
+        return await asyncio.to_thread(get_snapshot, task_id)
+
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(task_channel(task_id))
+    try:
+        state, payload = await asyncio.to_thread(get_snapshot, task_id)
+        if state in FINAL_STATES:
+            return state, payload
+        deadline = time.monotonic() + wait
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return state, payload
+            # get_message returns None for the subscribe confirmation too
+            if await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining) is not None:
+                break
+    finally:
+        await pubsub.unsubscribe(task_channel(task_id))
+        await pubsub.close()
+    return await asyncio.to_thread(get_snapshot, task_id)
@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+import math
+import datetime
+from dotenv import load_dotenv
+
+from services.redis_client import get_redis
+from services.error_logging import log_error_once
+
+load_dotenv()
+
+# API keys and what each customer may use, e.g.
+# {"key-abc": {"name": "acme", "weight": 3, "max_concurrency": 4, "quota_minutes": 6000}}
+# name: shown in /quota and used in Redis keys (default: derived from a hash of the key)
+# weight: share of throughput when several customers are queued
+# max_concurrency: jobs running at once (0 = no cap)
+# quota_minutes: audio minutes per calendar month, UTC (0 = no quota)
+# The legacy API_KEY stays valid as the "default" customer.
+API_KEYS = json.loads(os.getenv("API_KEYS", "{}"))
+DEFAULT_TENANT_WEIGHT = float(os.getenv("DEFAULT_TENANT_WEIGHT", "1"))
+DEFAULT_TENANT_MAX_CONCURRENCY = int(os.getenv("DEFAULT_TENANT_MAX_CONCURRENCY", "0"))
+DEFAULT_TENANT_QUOTA_MINUTES = float(os.getenv("DEFAULT_TENANT_QUOTA_MINUTES", "0"))
+
+# Adds 'minutes' unless that would pass the quota; returns {allowed, used}.
+CHARGE_SCRIPT = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local minutes = tonumber(ARGV[1])
+local quota = tonumber(ARGV[2])
+if quota > 0 and minutes > 0 and used + minutes > quota then
+    return {0, tostring(used)}
+end
+used = redis.call('INCRBYFLOAT', KEYS[1], minutes)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {1, tostring(used)}
+"""
+
+def get_tenant(api_key: str):
+    """
+    Returns {"name", "weight", "max_concurrency", "quota_minutes"} for
+    'api_key', or None when the key is unknown.
+    """
+    if not api_key:
+        return None
+    config = API_KEYS.get(api_key)
+    if config is None:
+        if api_key != os.getenv("API_KEY"):
+            return None
+        config = {"name": "default"}
+    return {
+        # never derive the name from the key itself: it ends up in Redis keys and /quota
+        "name": config.get("name") or "key-" + hashlib.sha256(api_key.encode()).hexdigest()[:12],
+        "weight": float(config.get("weight", DEFAULT_TENANT_WEIGHT)),
+        "max_concurrency": int(config.get("max_concurrency", DEFAULT_TENANT_MAX_CONCURRENCY)),
+        "quota_minutes": float(config.get("quota_minutes", DEFAULT_TENANT_QUOTA_MINUTES))
+    }
+
+def _quota_period(now: datetime.datetime = None) -> tuple:
+    """
+    (period label, seconds until the next period starts) for the current month.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    next_month = (now.replace(day=1) + datetime.timedelta(days=32)).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+    return now.strftime("%Y-%m"), max(1, math.ceil((next_month - now).total_seconds()))
+
+def quota_key(tenant_name: str, period: str) -> str:
+    return f"quota:{tenant_name}:{period}"
+
+def charge_audio_minutes(tenant: dict, seconds: float) -> tuple:
+    """
+    Books 'seconds' of audio against the tenant's monthly quota.
+    Returns (allowed, used_minutes, seconds_until_reset). Nothing is booked
+    when the quota would be exceeded. Without Redis nothing is tracked.
+    """
+    period, reset_in = _quota_period()
+    r = get_redis()
+    if r is None or not tenant or not seconds:
+        return True, 0.0, reset_in
+    try:
+        allowed, used = r.eval(
+            CHARGE_SCRIPT, 1, quota_key(tenant["name"], period),
+            seconds / 60.0, tenant["quota_minutes"], reset_in + 86400
+        )
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in charge_audio_minutes in tenants.py")
+        return True, 0.0, reset_in
+    return bool(allowed), float(used), reset_in
+
+def refund_audio_minutes(tenant: dict, seconds: float):
+    period, _ = _quota_period()
+    r = get_redis()
+    if r is None or not tenant or not seconds:
+        return
+    try:
+        r.incrbyfloat(quota_key(tenant["name"], period), -seconds / 60.0)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in refund_audio_minutes in tenants.py")
+
+def charge_key(task_id: str) -> str:
+    return f"quota:charge:{task_id}"
+
+def remember_charge(task_id: str, tenant: dict, seconds: float, ttl: int = 7 * 24 * 3600):
+    """
+    Records what a queued job was charged, so refund_failed_job can give it
+    back if the job fails.
+    """
+    r = get_redis()
+    if r is None or not tenant or not seconds:
+        return
+    try:
+        r.set(charge_key(task_id), json.dumps({"tenant": tenant, "seconds": seconds}), ex=ttl)
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in remember_charge in tenants.py")
+
+def refund_failed_job(task_id: str, failed: bool):
+    """
+    Called once a job is final: refunds its charge when it failed, and
+    forgets the charge either way.
+    """
+    r = get_redis()
+    if r is None or not task_id:
+        return
+    try:
+        raw = r.getdel(charge_key(task_id))
+    except Exception as e:
+        log_error_once(e, f"The error: {str(e)}, in refund_failed_job in tenants.py")
+        return
+    if raw and failed:
+        charge = json.loads(raw)
+        refund_audio_minutes(charge["tenant"], charge["seconds"])
+
+def get_quota_usage(tenant: dict) -> dict:
+    period, reset_in = _quota_period()
+    used = 0.0
+    r = get_redis()
+    if r is not None:
+        try:
+            used = float(r.get(quota_key(tenant["name"], period)) or 0.0)
+        except Exception as e:
+            log_error_once(e, f"The error: {str(e)}, in get_quota_usage in tenants.py")
+    return {
+        "tenant": tenant["name"],
+        "period": period,
+        "used_minutes": round(used, 2),
+        "quota_minutes": tenant["quota_minutes"] or None,
+        "resets_in": reset_in
+    }
@@ -1,22 +1,186 @@
+import os
 import asyncio
 import time
+from celery import chord
+from celery.exceptions import Ignore
+from celery.signals import task_postrun, task_prerun, worker_process_init
 from celeryapp import celery
 from fastapi import HTTPException
 from controller.audio import transcribe_audio_file
 from controller.video import transcribe_video_file
-from controller.youtube import transcribe_youtube_video
+from controller.youtube import runpod_result, transcribe_youtube_video
+from services.cache import get_cached_transcript, store_cached_transcript
+from services.checkpoints import clear_checkpoints, get_checkpoint, load_checkpoints, save_checkpoint
+from services.helper import (
+    ChunkProgress,
+    build_chunk_url,
+    build_transcription_result,
+    ensure_audio_only,
+    get_transcription_settings,
+    ingest_stream_to_chunks,
+    normalization_report,
+    safe_remove,
+    segment_media,
+    source_audio_bytes,
+    transcribe_stored_chunks
+)
+from services.runpod_client import get_transcription
+from services.singleflight import release_inflight
+from services.admission import record_job_completion
+from services.fair_queue import dispatch_ready, release_dispatched
+from services.tenants import refund_failed_job
+from services.task_events import FINAL_STATES, make_progress_reporter, publish_task_event
+from services.youtube_helper import (
+    YTDLP_IN_PROCESS,
+    store_cached_youtube_asr,
+    warm_shared_youtube_downloader,
+    youtube_audio_stream
+)
 from services.error_logging import log_error_once
 
-@celery.task
-def process_audio_task(file_path: str, start_time: float, main_upload_time: float) -> dict:
+# "inline" (default): the whole job runs inside one task; chunks go to
+# RunPod while ffmpeg is still segmenting and one worker process tracks many
+# RunPod jobs at once.
+# "canvas": segmentation task -> chord of per-chunk tasks -> merge task, so
+# chunks spread over the fleet and retry on their own. Segmentation finishes
+# before the first chunk is sent, and every chunk task holds a worker
+# process while its RunPod job runs, so size the pools for that.
+TRANSCRIPTION_PIPELINE = os.getenv("TRANSCRIPTION_PIPELINE", "inline")
+CHUNK_MAX_RETRIES = int(os.getenv("CHUNK_MAX_RETRIES", "3"))
+CHUNK_RETRY_DELAY = float(os.getenv("CHUNK_RETRY_DELAY", "10"))  # seconds, doubled per retry
+
+_worker_loop = None
+
+@worker_process_init.connect
+def warm_youtube_downloader(**kwargs):
+    # extractors load once per worker process instead of on the first video
+    if YTDLP_IN_PROCESS:
+        warm_shared_youtube_downloader()
+
+@task_prerun.connect
+def publish_task_started(task_id=None, **kwargs):
+    publish_task_event(task_id, "state", {"status": "STARTED"})
+
+@task_postrun.connect
+def publish_task_result(task_id=None, task=None, retval=None, state=None, **kwargs):
+    """
+    Closes /task_stream/{task_id} listeners with the final result once the
+    result backend has it. Chunk tasks finish as part of their job.
+    """
+    if state not in FINAL_STATES or (task is not None and task.name == transcribe_chunk_task.name):
+        return
+    release_inflight(task_id)
+    refund_failed_job(task_id, state != "SUCCESS" or (isinstance(retval, dict) and retval.get("status_code") != 200))
+    record_job_completion(task_id)
+    release_dispatched(task_id)
+    dispatch_ready()
+    publish_task_event(task_id, "result", retval if state == "SUCCESS" else {"status_code": 500, "state": state})
+
+def run_async(coro):
+    """
+    Runs 'coro' on this worker process's long-lived event loop, so pooled
+    async clients (e.g. the RunPod client) are reused across tasks.
+    """
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop.run_until_complete(coro)
+
+# Per-run timings are not part of what we cache for a transcript.
+TIMING_KEYS = ("chunk_time", "transcription_time", "upload_time", "total_time", "runpod_queue_wait_time",
+               "normalization")
+
+def cacheable_transcription(data_dict: dict) -> dict:
+    return {k: v for k, v in data_dict.items() if k not in TIMING_KEYS}
+
+def cached_upload_result(cached: dict, start_time: float, main_upload_time: float) -> dict:
+    data_dict = dict(cached)
+    data_dict["cached"] = True
+    data_dict["upload_time"] = main_upload_time
+    data_dict["transcription_time"] = 0.0
+    data_dict["total_time"] = time.time() - start_time
+    return {"status_code": 200, "data": data_dict}
+
+def use_canvas() -> bool:
+    return TRANSCRIPTION_PIPELINE == "canvas"
+
+def start_chunk_canvas(task, job: dict):
+    """
+    Segments job["file_path"] in this task, then replaces the task with a
+    chord of one transcribe_chunk_task per chunk and merge_chunks_task as
+    its body. The chord keeps this task's id, so /task_status and
+    /task_stream see the merged result under the id the client already has.
+    """
+    normalize = job["settings"].get("normalize", False)
+    source_bytes = source_audio_bytes(job["file_path"]) if normalize else None
+    chunk_start = time.time()
+    try:
+        chunks = segment_media(job["file_path"], **job["settings"])
+    finally:
+        for path in job.get("cleanup_paths", [job["file_path"]]):
+            safe_remove(path)
+    chunk_time = time.time() - chunk_start
+    normalization = normalization_report(source_bytes, chunks, chunk_time) if normalize else None
+    return fan_out_chunks(task, job, chunks, chunk_time, normalization)
+
+def fan_out_chunks(task, job: dict, chunks: list, chunk_time: float, normalization: dict = None):
+    """
+    Replaces 'task' with a chord of one transcribe_chunk_task per chunk
+    (already on disk) and merge_chunks_task as its body.
+    """
+    delivery_info = task.request.delivery_info or {}
+    job = dict(
+        job,
+        job_id=task.request.id,
+        # chunks stay in the job's duration queue and priority
+        routing={
+            k: v for k, v in (("queue", delivery_info.get("routing_key")), ("priority", delivery_info.get("priority")))
+            if v is not None
+        },
+        chunks=chunks,
+        chunk_time=chunk_time,
+        normalization=normalization,
+        transcription_start=time.time()
+    )
+    progress = ChunkProgress(make_progress_reporter(task))
+    for chunk in chunks:
+        progress.add_chunk(chunk)
+    progress.segmentation_done()
+
+    header = [
+        transcribe_chunk_task.si(job["job_id"], chunk, index, len(chunks)).set(**job["routing"])
+        for index, chunk in enumerate(chunks)
+    ]
+    return task.replace(chord(header, merge_chunks_task.s(job).set(**job["routing"])))
+
+@celery.task(bind=True)
+def process_audio_task(self, file_path: str, start_time: float, main_upload_time: float,
+                       content_hash: str = None, use_cache: bool = True) -> dict:
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        settings = get_transcription_settings()
+        if use_cache:
+            cached = get_cached_transcript(content_hash, settings)
+            if cached is not None:
+                safe_remove(file_path)
+                return cached_upload_result(cached, start_time, main_upload_time)
 
-        result = loop.run_until_complete(transcribe_audio_file(file_path))
+        if use_canvas():
+            return start_chunk_canvas(self, {
+                "kind": "audio",
+                "file_path": file_path,
+                "start_time": start_time,
+                "main_upload_time": main_upload_time,
+                "content_hash": content_hash,
+                "settings": settings
+            })
+
+        result = run_async(transcribe_audio_file(file_path, make_progress_reporter(self), self.request.id))
         data_dict = result.get("data", {})
         if not isinstance(data_dict, dict):
             data_dict = {}
+        if result.get("status_code") == 200:
+            store_cached_transcript(content_hash, settings, cacheable_transcription(data_dict))
 
         chunk_time = data_dict.pop("chunk_time", 0.0)
         transcription_time = data_dict.pop("transcription_time", 0.0)
@@ -32,6 +196,8 @@ def process_audio_task(file_path: str, start_time: float, main_upload_time: floa
 
         return result
 
+    except Ignore:
+        raise
     except HTTPException as e:
         # Only log if this is not already reported
         log_error_once(e, f"The error: {e.detail}, in process_audio_task in tasks.py")
@@ -50,16 +216,33 @@ def process_audio_task(file_path: str, start_time: float, main_upload_time: floa
             }
         }
 
-@celery.task
-def process_video_task(file_path: str, start_time: float, main_upload_time: float) -> dict:
+@celery.task(bind=True)
+def process_video_task(self, file_path: str, start_time: float, main_upload_time: float,
+                       content_hash: str = None, use_cache: bool = True) -> dict:
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        settings = get_transcription_settings()
+        if use_cache:
+            cached = get_cached_transcript(content_hash, settings)
+            if cached is not None:
+                safe_remove(file_path)
+                return cached_upload_result(cached, start_time, main_upload_time)
+
+        if use_canvas():
+            return start_chunk_canvas(self, {
+                "kind": "video",
+                "file_path": file_path,
+                "start_time": start_time,
+                "main_upload_time": main_upload_time,
+                "content_hash": content_hash,
+                "settings": settings
+            })
 
-        result = loop.run_until_complete(transcribe_video_file(file_path))
+        result = run_async(transcribe_video_file(file_path, make_progress_reporter(self), self.request.id))
         data_dict = result.get("data", {})
         if not isinstance(data_dict, dict):
             data_dict = {}
+        if result.get("status_code") == 200:
+            store_cached_transcript(content_hash, settings, cacheable_transcription(data_dict))
 
         chunk_time = data_dict.pop("chunk_time", 0.0)
         transcription_time = data_dict.pop("transcription_time", 0.0)
@@ -74,6 +257,8 @@ def process_video_task(file_path: str, start_time: float, main_upload_time: floa
         result["data"] = data_dict
         return result
 
+    except Ignore:
+        raise
     except HTTPException as e:
         log_error_once(e, f"The error: {e.detail}, in process_video_task in tasks.py")
         return {
@@ -91,36 +276,214 @@ def process_video_task(file_path: str, start_time: float, main_upload_time: floa
             }
         }
 
-@celery.task
-def process_youtube_task(youtube_url: str, is_runpod: bool, start_time: float) -> dict:
+@celery.task(bind=True)
+def process_streamed_video_task(self, chunks: list, start_time: float, main_upload_time: float,
+                                content_hash: str = None, use_cache: bool = True) -> dict:
+    """
+    Transcribes a video whose audio chunks were cut while it was uploaded
+    (/transcribe_video/stream). There is no source file left, only 'chunks'.
+    """
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        settings = get_transcription_settings(chunking="fixed", overlap=0.0)
+        if use_cache:
+            cached = get_cached_transcript(content_hash, settings)
+            if cached is not None:
+                for chunk in chunks:
+                    safe_remove(chunk["path"])
+                return cached_upload_result(cached, start_time, main_upload_time)
+
+        if use_canvas():
+            return fan_out_chunks(self, {
+                "kind": "video",
+                "start_time": start_time,
+                "main_upload_time": main_upload_time,
+                "content_hash": content_hash,
+                "settings": settings
+            }, chunks, 0.0)
+
+        transcription = run_async(
+            transcribe_stored_chunks(chunks, 0.0, make_progress_reporter(self), self.request.id)
+        )
+        store_cached_transcript(content_hash, settings, cacheable_transcription(transcription))
+
+        data_dict = dict(transcription)
+        chunk_time = data_dict.pop("chunk_time", 0.0)
+        data_dict["upload_time"] = main_upload_time + chunk_time
+        data_dict["total_time"] = time.time() - start_time
+        return {"status_code": 200, "data": data_dict}
+
+    except Ignore:
+        raise
+    except HTTPException as e:
+        log_error_once(e, f"The error: {e.detail}, in process_streamed_video_task in tasks.py")
+        return {
+            "status_code": e.status_code,
+            "data": {
+                "detail": f"HTTPException: {e.detail}"
+            }
+        }
+    except Exception as gen_err:
+        log_error_once(gen_err, f"The error: {str(gen_err)}, in process_streamed_video_task in tasks.py")
+        return {
+            "status_code": 500,
+            "data": {
+                "detail": f"Unhandled exception: {str(gen_err)}"
+            }
+        }
 
+def youtube_task_result(result: dict, tstart: float, tend: float, start_time: float) -> dict:
+    if "data" not in result:
+        new_data = {}
+        for k in ("is_runpod", "all_transcripts", "transcript", "status_code"):
+            if k in result:
+                new_data[k] = result.pop(k)
+        result["data"] = new_data
+
+    data_dict = result["data"]
+    transcription_time = tend - tstart
+    total_time = tend - start_time
+
+    data_dict["upload_time"] = 0
+    data_dict["transcription_time"] = transcription_time
+    data_dict["total_time"] = total_time
+
+    result["status_code"] = 200
+    return result
+
+@celery.task(bind=True)
+def process_youtube_task(self, youtube_url: str, is_runpod: bool, start_time: float, use_cache: bool = True) -> dict:
+    try:
         tstart = time.time()
-        result = loop.run_until_complete(transcribe_youtube_video(youtube_url, is_runpod))
+        result = run_async(transcribe_youtube_video(
+            youtube_url, is_runpod, use_cache, make_progress_reporter(self),
+            defer_asr=use_canvas(), job_id=self.request.id
+        ))
+        pending = result.get("pending_asr")
+        if pending:
+            job = {
+                "kind": "youtube",
+                "start_time": start_time,
+                "task_start": tstart,
+                "video_id": pending["video_id"],
+                "video_metadata": pending["video_metadata"],
+                "settings": pending["settings"]
+            }
+            if pending.get("stream_url"):
+                # yt-dlp piped into the segmenter, no audio file in between
+                ingest = run_async(ingest_stream_to_chunks(
+                    youtube_audio_stream(pending["stream_url"]), pending["settings"]["segment_time"]
+                ))
+                return fan_out_chunks(self, job, ingest["chunks"], ingest["ingest_time"])
+            audio_file = ensure_audio_only(pending["local_path"])
+            return start_chunk_canvas(self, dict(
+                job,
+                file_path=audio_file,
+                cleanup_paths=list({audio_file, pending["local_path"]})
+            ))
         tend = time.time()
+        return youtube_task_result(result, tstart, tend, start_time)
 
-        if "data" not in result:
-            new_data = {}
-            for k in ("is_runpod", "all_transcripts", "transcript", "status_code"):
-                if k in result:
-                    new_data[k] = result.pop(k)
-            result["data"] = new_data
+    except Ignore:
+        raise
+    except HTTPException as e:
+        log_error_once(e, f"The error: {e.detail}, in process_youtube_task in tasks.py")
+        return {
+            "status_code": e.status_code,
+            "data": {
+                "detail": f"HTTPException: {e.detail}"
+            }
+        }
+    except Exception as gen_err:
+        log_error_once(gen_err, f"The error: {str(gen_err)}, in process_youtube_task in tasks.py")
+        return {
+            "status_code": 500,
+            "data": {
+                "detail": f"Unhandled exception: {str(gen_err)}"
+            }
+        }
 
-        data_dict = result["data"]
-        transcription_time = tend - tstart
-        total_time = tend - start_time
+@celery.task(bind=True, max_retries=CHUNK_MAX_RETRIES)
+def transcribe_chunk_task(self, job_id: str, chunk: dict, index: int, total_chunks: int) -> dict:
+    """
+    Transcribes 'chunk' (number 'index' of 'total_chunks') of job 'job_id'
+    on RunPod, unless it is already checkpointed. Server-side
+    failures are retried with exponential backoff; once retries run out the
+    error is returned (not raised) so the chord still reaches the merge task.
+    """
+    # A redelivered or duplicated chunk task reuses the stored transcript.
+    result = get_checkpoint(job_id, index, chunk)
+    if result is not None:
+        return {"index": index, "result": result}
+    try:
+        result = run_async(get_transcription(build_chunk_url(chunk["path"])))
+    except Exception as e:
+        status_code = getattr(e, "status_code", 500)
+        detail = getattr(e, "detail", str(e))
+        if status_code >= 500 and self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=CHUNK_RETRY_DELAY * 2 ** self.request.retries)
+        log_error_once(e, f"The error: {detail}, in transcribe_chunk_task in tasks.py")
+        return {"index": index, "status_code": status_code, "detail": f"Chunk {index} failed: {detail}"}
 
-        data_dict["upload_time"] = 0
-        data_dict["transcription_time"] = transcription_time
-        data_dict["total_time"] = total_time
+    save_checkpoint(job_id, index, chunk, result)
+    # the partial transcript is rebuilt from the checkpointed chunks
+    done = load_checkpoints(job_id)
+    progress = ChunkProgress(make_progress_reporter(self, job_id))
+    progress.chunks = [None] * total_chunks
+    for i, entry in done.items():
+        progress.chunks[i] = entry["chunk"]
+    progress.chunks[index] = chunk
+    progress.total_chunks = total_chunks
+    progress.results = {i: entry["result"] for i, entry in done.items() if i != index}
+    progress.chunk_done(index, result)
+    return {"index": index, "result": result}
 
+def finish_canvas_job(job: dict, transcription: dict) -> dict:
+    """
+    Caches 'transcription' and wraps it in the same envelope (and timings)
+    the inline tasks return for the job's kind.
+    """
+    now = time.time()
+    if job["kind"] == "youtube":
+        store_cached_youtube_asr(job["video_id"], job["settings"], transcription)
+        result = runpod_result(job["video_metadata"], dict(transcription))
+        data_dict = result["data"]
+        data_dict["upload_time"] = 0
+        data_dict["transcription_time"] = now - job["task_start"]
+        data_dict["total_time"] = now - job["start_time"]
         result["status_code"] = 200
         return result
 
+    store_cached_transcript(job["content_hash"], job["settings"], cacheable_transcription(transcription))
+    data_dict = dict(transcription)
+    chunk_time = data_dict.pop("chunk_time", 0.0)
+    data_dict["upload_time"] = job["main_upload_time"] + chunk_time
+    data_dict["total_time"] = now - job["start_time"]
+    return {"status_code": 200, "data": data_dict}
+
+@celery.task(bind=True)
+def merge_chunks_task(self, chunk_results: list, job: dict) -> dict:
+    """
+    Chord body: merges the chunk transcripts in order and removes the chunk
+    files. Runs under the original job's task id.
+    """
+    try:
+        failed = [r for r in chunk_results if "result" not in r]
+        if failed:
+            raise HTTPException(status_code=failed[0]["status_code"], detail=failed[0]["detail"])
+
+        ordered = sorted(chunk_results, key=lambda r: r["index"])
+        transcription = build_transcription_result(
+            [r["result"] for r in ordered],
+            job["chunks"],
+            job["chunk_time"],
+            time.time() - job["transcription_start"]
+        )
+        if job.get("normalization"):
+            transcription["normalization"] = job["normalization"]
+        return finish_canvas_job(job, transcription)
+
     except HTTPException as e:
-        log_error_once(e, f"The error: {e.detail}, in process_youtube_task in tasks.py")
+        log_error_once(e, f"The error: {e.detail}, in merge_chunks_task in tasks.py")
         return {
             "status_code": e.status_code,
             "data": {
@@ -128,10 +491,14 @@ def process_youtube_task(youtube_url: str, is_runpod: bool, start_time: float) -
             }
         }
     except Exception as gen_err:
-        log_error_once(gen_err, f"The error: {str(gen_err)}, in process_youtube_task in tasks.py")
+        log_error_once(gen_err, f"The error: {str(gen_err)}, in merge_chunks_task in tasks.py")
         return {
             "status_code": 500,
             "data": {
                 "detail": f"Unhandled exception: {str(gen_err)}"
             }
         }
+    finally:
+        for chunk in job["chunks"]:
+            safe_remove(chunk["path"])
+        clear_checkpoints(job["job_id"])